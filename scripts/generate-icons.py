@@ -1,19 +1,36 @@
 #!/usr/bin/env python3
 """
 Genera icone gradient oro per iOS/Android nel layout "Bureaucracy Agent".
+
+L'icona viene disegnata una sola volta alla dimensione master (gradiente e alone calcolati
+con NumPy), poi ridimensionata con Lanczos per ogni dimensione distinta; ridimensionamento e
+salvataggio PNG girano in un process pool. Le icone il cui hash dei parametri non è cambiato
+(vedi `.icons-manifest.json`) non vengono riscritte: usa `--force` per rigenerarle tutte.
+
+Richiede Pillow e NumPy (`pip install pillow numpy`).
 """
+import argparse
+import hashlib
+import io
+import json
 import os
-
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
 ROOT = Path(__file__).resolve().parents[1]
 OUTPUT_DIR = ROOT / "assets" / "icons" / "generated"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+MANIFEST_PATH = OUTPUT_DIR / ".icons-manifest.json"
 
 GOLD = (200, 161, 92)
 LIGHT_GOLD = (244, 215, 138)
 BACKGROUND = (3, 3, 3)
+GLOW_ALPHA = 50
+MASTER_SIZE = 1024
 
 IOS_ICON_SIZES = {
     "Icon-App-20x20@1x": 20,
@@ -56,40 +73,42 @@ FONT_PATHS = [
 ]
 
 
-def create_icon(size: int) -> Image.Image:
-    img = Image.new("RGB", (size, size), BACKGROUND)
-    draw = ImageDraw.Draw(img)
+def find_font_path() -> Optional[str]:
+    for path in FONT_PATHS:
+        if Path(path).exists():
+            return path
+    return None
+
+
+def render_layers(size: int) -> np.ndarray:
     center = size // 2
     radius = int(size * 0.4)
+    ys, xs = np.ogrid[:size, :size]
+    distance = np.sqrt((xs - center) ** 2 + (ys - center) ** 2)
 
-    for i in range(radius, 0, -1):
-        factor = i / radius
-        r = int(GOLD[0] * factor + LIGHT_GOLD[0] * (1 - factor))
-        g = int(GOLD[1] * factor + LIGHT_GOLD[1] * (1 - factor))
-        b = int(GOLD[2] * factor + LIGHT_GOLD[2] * (1 - factor))
-        draw.ellipse(
-            [
-                (center - i, center - i),
-                (center + i, center + i),
-            ],
-            outline=(r, g, b),
-            width=max(1, int(size * 0.01)),
-        )
-
-    glow = Image.new("RGBA", img.size, (0, 0, 0, 0))
-    glow_draw = ImageDraw.Draw(glow)
-    glow_draw.ellipse(
-        [(center - radius - 10, center - radius - 10), (center + radius + 10, center + radius + 10)],
-        fill=(244, 215, 138, 50),
-    )
-    img = Image.alpha_composite(img.convert("RGBA"), glow).convert("RGB")
+    pixels = np.empty((size, size, 3), dtype=np.float32)
+    pixels[:] = BACKGROUND
+    inside = distance <= radius
+    factor = (distance[inside] / radius)[:, None]
+    gold = np.array(GOLD, dtype=np.float32)
+    light_gold = np.array(LIGHT_GOLD, dtype=np.float32)
+    pixels[inside] = np.floor(gold * factor + light_gold * (1 - factor))
 
-    font = None
-    for path in FONT_PATHS:
-        if Path(path).exists():
-            font = ImageFont.truetype(path, int(radius * 1.2))
-            break
-    if font is None:
+    glow = distance <= radius + 10
+    alpha = GLOW_ALPHA / 255
+    pixels[glow] = pixels[glow] * (1 - alpha) + light_gold * alpha
+    return np.clip(np.rint(pixels), 0, 255).astype(np.uint8)
+
+
+def create_icon(size: int, font_path: Optional[str] = None) -> Image.Image:
+    img = Image.fromarray(render_layers(size), "RGB")
+    draw = ImageDraw.Draw(img)
+    center = size // 2
+    radius = int(size * 0.4)
+
+    if font_path is not None:
+        font = ImageFont.truetype(font_path, int(radius * 1.2))
+    else:
         font = ImageFont.load_default()
 
     text = "B"
@@ -106,24 +125,83 @@ def create_icon(size: int) -> Image.Image:
     wave_height = int(size * 0.05)
     wave_width = int(size * 0.6)
     start_x = center - wave_width // 2
-    for i in range(wave_width):
-        val = 1 - abs((i - wave_width / 2) / (wave_width / 2))
-        wave_y = int(center + radius * 0.6 + val * wave_height)
-        draw.line(
-            [(start_x + i, wave_y), (start_x + i, wave_y - int(val * wave_height / 2))],
-            fill=LIGHT_GOLD,
-        )
+    columns = np.arange(wave_width)
+    val = 1 - np.abs((columns - wave_width / 2) / (wave_width / 2))
+    bottom = (center + radius * 0.6 + val * wave_height).astype(int)
+    top = bottom - (val * wave_height / 2).astype(int)
+    rows = np.arange(size)[:, None]
+    mask = np.zeros((size, size), dtype=bool)
+    mask[:, start_x:start_x + wave_width] = (rows >= top) & (rows <= bottom)
+    pixels = np.array(img)
+    pixels[mask] = LIGHT_GOLD
+    return Image.fromarray(pixels, "RGB")
+
+
+def params_hash(size: int, font_path: Optional[str]) -> str:
+    digest = hashlib.sha256()
+    digest.update(Path(__file__).read_bytes())
+    digest.update(json.dumps([MASTER_SIZE, size, font_path]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+_MASTER: Optional[Image.Image] = None
 
-    return img
+
+def _init_worker(master_bytes: bytes, master_size: int) -> None:
+    global _MASTER
+    _MASTER = Image.frombytes("RGB", (master_size, master_size), master_bytes)
+
+
+def _write_size(size: int, names: List[str]) -> Tuple[int, List[str]]:
+    img = _MASTER if size == _MASTER.width else _MASTER.resize((size, size), Image.Resampling.LANCZOS)
+    encoded = io.BytesIO()
+    img.save(encoded, format="PNG", optimize=True)
+    for name in names:
+        (OUTPUT_DIR / f"{name}.png").write_bytes(encoded.getvalue())
+    return size, names
+
+
+def load_manifest() -> Dict[str, str]:
+    if not MANIFEST_PATH.exists():
+        return {}
+    return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Genera le icone dell'app.")
+    parser.add_argument("--force", action="store_true", help="rigenera anche le icone invariate")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
     print("Generazione icone Bureaucracy Agent...")
+    font_path = find_font_path()
+    manifest = {} if args.force else load_manifest()
+    hashes = {name: params_hash(size, font_path) for name, size in ICON_SIZES.items()}
+
+    pending: Dict[int, List[str]] = {}
     for name, size in ICON_SIZES.items():
-        img = create_icon(size)
-        target = OUTPUT_DIR / f"{name}.png"
-        img.save(target, optimize=True)
-        print(f"  ✅ {target.name} ({size}px)")
+        if manifest.get(name) == hashes[name] and (OUTPUT_DIR / f"{name}.png").exists():
+            continue
+        pending.setdefault(size, []).append(name)
+
+    if not pending:
+        print(f"Icone già aggiornate in {OUTPUT_DIR}")
+        return
+
+    master = create_icon(MASTER_SIZE, font_path)
+    with ProcessPoolExecutor(
+        max_workers=min(args.workers, len(pending)),
+        initializer=_init_worker,
+        initargs=(master.tobytes(), MASTER_SIZE),
+    ) as pool:
+        # Largest sizes first so the slowest PNG encodes start early.
+        sizes = sorted(pending, reverse=True)
+        for size, names in pool.map(_write_size, sizes, [pending[size] for size in sizes]):
+            for name in names:
+                manifest[name] = hashes[name]
+                print(f"  ✅ {name}.png ({size}px)")
+
+    MANIFEST_PATH.write_text(json.dumps(manifest, indent=2, sort_keys=True) + "\n", encoding="utf-8")
     print(f"Icone generate in {OUTPUT_DIR}")
 
 
@@ -0,0 +1,69 @@
+import asyncio
+import math
+from collections import deque
+from typing import Deque
+
+
+class AdmissionLane:
+    """Limita le richieste in volo per endpoint con una coda d'attesa limitata e una scadenza."""
+
+    def __init__(
+        self,
+        name: str,
+        max_in_flight: int,
+        max_queue: int,
+        queue_timeout: float,
+        initial_service_time: float = 0.1,
+    ):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.service_time = initial_service_time
+        self.in_flight = 0
+        self._waiters: "Deque[asyncio.Future[None]]" = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.max_queue or self.queue_timeout <= 0:
+            return False
+
+        waiter: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            # On 3.12+ the deadline can win even though release() already handed us the slot
+            # in the same loop iteration: keep it instead of leaking it.
+            return waiter.done() and not waiter.cancelled()
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before the client went away.
+            if waiter.done() and not waiter.cancelled():
+                self._hand_over()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self, elapsed: float) -> None:
+        self.service_time = 0.8 * self.service_time + 0.2 * elapsed
+        self._hand_over()
+
+    def retry_after(self) -> int:
+        backlog = self.queued + self.in_flight + 1
+        return max(1, math.ceil(self.service_time * backlog / max(1, self.max_in_flight)))
+
+    def _hand_over(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
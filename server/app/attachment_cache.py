@@ -0,0 +1,75 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .schemas import Attachment, Reference
+from .tiered_cache import TieredCache
+
+Extraction = Tuple[Dict[str, str], bool, List[Reference]]
+
+
+def attachment_key(attachments: List[Attachment]) -> Optional[str]:
+    hashes = sorted({attachment.hash.lower() for attachment in attachments})
+    if not hashes:
+        return None
+    if len(hashes) == 1:
+        return hashes[0]
+    return hashlib.sha256("\n".join(hashes).encode("ascii")).hexdigest()
+
+
+class AttachmentCache:
+    """Estrazioni (entità, multa sì/no, riferimenti) indicizzate per hash SHA-256 degli allegati.
+
+    Ogni voce conserva anche il digest del testo analizzato e la revisione (hash del contenuto) del VectorStore: se lo
+    stesso allegato arriva con un testo diverso, o le norme sono cambiate, la voce non viene riusata.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 2000,
+        db_path: Optional[Path] = None,
+        disk_max_entries: int = 100000,
+    ):
+        self._cache = TieredCache("attachments", max_entries, db_path, disk_max_entries)
+
+    def get(self, key: str, text: str, store_revision: str = "") -> Optional[Extraction]:
+        raw = self._cache.get(key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        if entry["text_digest"] != _digest(text) or entry.get("store_revision") != store_revision:
+            return None
+        references = [Reference.model_validate(reference) for reference in entry["references"]]
+        return entry["entities"], entry["is_fine"], references
+
+    def put(self, key: str, text: str, extraction: Extraction, store_revision: str = "") -> None:
+        entities, is_fine, references = extraction
+        entry = {
+            "text_digest": _digest(text),
+            "store_revision": store_revision,
+            "entities": entities,
+            "is_fine": is_fine,
+            "references": [reference.model_dump(mode="json") for reference in references],
+        }
+        self._cache.put(key, json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+
+    @property
+    def persistent(self) -> bool:
+        return self._cache.persistent
+
+    def flush(self) -> None:
+        self._cache.flush()
+
+    def close(self) -> None:
+        self._cache.close()
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
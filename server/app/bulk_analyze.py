@@ -0,0 +1,285 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+
+from pydantic import ValidationError
+
+from .schemas import AnalyzeRequest, AnalyzeResponse, Summary
+
+# NDJSON lines travel as raw strings and are parsed by the workers; CSV rows are already dicts.
+Record = Tuple[int, Any]
+ChunkResult = Tuple[int, float, List[Tuple[int, str]]]
+
+METADATA_COLUMNS = ("user_id", "issue_date", "amount", "jurisdiction")
+
+
+def _init_worker() -> None:
+    # Importing the engine loads the VectorStore once per worker process.
+    from . import engine  # noqa: F401
+
+
+def _analyze_chunk(chunk: List[Record]) -> ChunkResult:
+    from .engine import analyze_text, build_summary
+
+    started = time.perf_counter()
+    lines: List[Tuple[int, str]] = []
+    for index, raw in chunk:
+        try:
+            if isinstance(raw, str):
+                payload = AnalyzeRequest.model_validate_json(raw)
+            else:
+                payload = AnalyzeRequest.model_validate(raw)
+        except ValidationError as exc:
+            error = {
+                "index": index,
+                "document_id": _document_id(raw),
+                "error": exc.errors(include_url=False, include_input=False),
+            }
+            lines.append((index, json.dumps(error, ensure_ascii=False, default=str)))
+            continue
+        issues = analyze_text(payload)
+        risk_level, next_step = build_summary(issues, payload)
+        response = AnalyzeResponse(
+            document_id=payload.document_id,
+            results=issues,
+            summary=Summary(risk_level=risk_level, next_step=next_step),
+            server_time=datetime.now(timezone.utc).isoformat(),
+        )
+        lines.append((index, response.model_dump_json()))
+    return os.getpid(), time.perf_counter() - started, lines
+
+
+def _document_id(raw: Any) -> Any:
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            return None
+    return raw.get("document_id") if isinstance(raw, dict) else None
+
+
+def _read_ndjson(handle: TextIO) -> Iterator[str]:
+    # Malformed lines are not fatal: the worker turns them into per-record error rows.
+    for line in handle:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def _read_csv(handle: TextIO) -> Iterator[Dict[str, Any]]:
+    for row in csv.DictReader(handle):
+        record: Dict[str, Any] = {key: value for key, value in row.items() if key not in METADATA_COLUMNS}
+        record["metadata"] = {key: row.get(key) for key in METADATA_COLUMNS}
+        yield record
+
+
+def read_records(paths: List[str], input_format: str) -> Iterator[Any]:
+    for path in paths or ["-"]:
+        fmt = input_format
+        if fmt == "auto":
+            fmt = "csv" if path.lower().endswith(".csv") else "ndjson"
+        reader = _read_csv if fmt == "csv" else _read_ndjson
+        if path == "-":
+            yield from reader(sys.stdin)
+            continue
+        with open(path, encoding="utf-8", newline="") as handle:
+            yield from reader(handle)
+
+
+def _chunks(records: Iterable[Any], size: int, skip: Set[int], start: int) -> Iterator[List[Record]]:
+    chunk: List[Record] = []
+    for index, record in enumerate(records):
+        if index < start or index in skip:
+            continue
+        chunk.append((index, record))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Checkpoint:
+    """Indici completati (tutto sotto `watermark` più quelli sparsi oltre) e byte di output che li contengono.
+
+    Alla ripresa l'output va troncato a `output_offset`: le righe scritte dopo l'ultimo salvataggio
+    verrebbero altrimenti duplicate, perché i loro indici non risultano completati.
+    """
+
+    def __init__(self, path: Optional[Path], interval: float = 2.0):
+        self.path = path
+        self.interval = interval
+        self.watermark = 0
+        self.done: Set[int] = set()
+        self.output_offset: Optional[int] = None
+        self._last_save = time.monotonic()
+        if path is not None and path.exists():
+            state = json.loads(path.read_text(encoding="utf-8"))
+            self.watermark = state["watermark"]
+            self.done = set(state["done"])
+            self.output_offset = state.get("output_offset")
+
+    def mark(self, index: int) -> None:
+        self.done.add(index)
+        while self.watermark in self.done:
+            self.done.discard(self.watermark)
+            self.watermark += 1
+
+    def maybe_save(self, output: TextIO) -> None:
+        if time.monotonic() - self._last_save >= self.interval:
+            self.save(output)
+
+    def save(self, output: TextIO) -> None:
+        if self.path is None:
+            return
+        output.flush()
+        if output.seekable():
+            self.output_offset = output.tell()
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(
+            json.dumps({"watermark": self.watermark, "done": sorted(self.done), "output_offset": self.output_offset}),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, self.path)
+        self._last_save = time.monotonic()
+
+
+class Throughput:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.documents = 0
+        self.busy: Dict[int, float] = {}
+        self.per_worker: Dict[int, int] = {}
+        self._started = time.perf_counter()
+
+    def add(self, pid: int, busy: float, count: int) -> None:
+        self.documents += count
+        self.busy[pid] = self.busy.get(pid, 0.0) + busy
+        self.per_worker[pid] = self.per_worker.get(pid, 0) + count
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._started
+        rate = self.documents / elapsed if elapsed else 0.0
+        return {
+            "documents": self.documents,
+            "elapsed_s": round(elapsed, 3),
+            "docs_per_s": round(rate, 1),
+            "workers": self.workers,
+            "docs_per_s_per_worker": round(rate / self.workers, 1),
+            "worker_utilization": {
+                str(pid): round(busy / elapsed, 3) if elapsed else 0.0 for pid, busy in sorted(self.busy.items())
+            },
+            "docs_per_worker": {str(pid): count for pid, count in sorted(self.per_worker.items())},
+        }
+
+
+def run(
+    records: Iterable[Any],
+    output: TextIO,
+    workers: int,
+    chunk_size: int = 32,
+    max_in_flight: int = 8,
+    ordered: bool = True,
+    checkpoint: Optional[Checkpoint] = None,
+) -> Dict[str, Any]:
+    checkpoint = checkpoint or Checkpoint(None)
+    stats = Throughput(workers)
+    chunks = _chunks(records, chunk_size, set(checkpoint.done), checkpoint.watermark)
+
+    def emit(result: ChunkResult) -> None:
+        pid, busy, lines = result
+        for index, line in lines:
+            output.write(line + "\n")
+            checkpoint.mark(index)
+        stats.add(pid, busy, len(lines))
+        checkpoint.maybe_save(output)
+
+    try:
+        with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+            if ordered:
+                pending: "deque[Any]" = deque()
+                for chunk in chunks:
+                    pending.append(pool.apply_async(_analyze_chunk, (chunk,)))
+                    if len(pending) >= max_in_flight:
+                        emit(pending.popleft().get())
+                while pending:
+                    emit(pending.popleft().get())
+            else:
+                completed: "queue.Queue[Any]" = queue.Queue()
+                in_flight = 0
+                for chunk in chunks:
+                    pool.apply_async(
+                        _analyze_chunk,
+                        (chunk,),
+                        callback=completed.put,
+                        error_callback=completed.put,
+                    )
+                    in_flight += 1
+                    while in_flight >= max_in_flight:
+                        emit(_take(completed))
+                        in_flight -= 1
+                while in_flight:
+                    emit(_take(completed))
+                    in_flight -= 1
+    finally:
+        checkpoint.save(output)
+    return stats.report()
+
+
+def _take(completed: "queue.Queue[Any]") -> ChunkResult:
+    result = completed.get()
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Analizza in blocco record AnalyzeRequest (NDJSON/CSV) e scrive i risultati in NDJSON."
+    )
+    parser.add_argument("inputs", nargs="*", help="file di input (default stdin, '-' per stdin)")
+    parser.add_argument("--format", choices=["auto", "ndjson", "csv"], default="auto")
+    parser.add_argument("--output", type=Path, help="file NDJSON di destinazione (default stdout)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=32, help="record per task inviato ai worker")
+    parser.add_argument("--max-in-flight", type=int, default=0, help="task in volo (default 2 x workers)")
+    parser.add_argument("--unordered", action="store_true", help="scrive in ordine di completamento")
+    parser.add_argument("--checkpoint", type=Path, help="file di checkpoint per riprendere un'esecuzione")
+    args = parser.parse_args(argv)
+
+    checkpoint = Checkpoint(args.checkpoint)
+    resuming = checkpoint.watermark > 0 or bool(checkpoint.done)
+    if args.output:
+        if resuming and checkpoint.output_offset is not None and args.output.exists():
+            # Drop rows written after the last checkpoint: they are about to be produced again.
+            os.truncate(args.output, checkpoint.output_offset)
+        output: TextIO = args.output.open("a" if resuming else "w", encoding="utf-8")
+    else:
+        output = sys.stdout
+    try:
+        report = run(
+            read_records(args.inputs, args.format),
+            output,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            max_in_flight=args.max_in_flight or 2 * args.workers,
+            ordered=not args.unordered,
+            checkpoint=checkpoint,
+        )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(json.dumps({"event": "bulk_analyze.report", **report}), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+import atexit
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .attachment_cache import AttachmentCache, Extraction, attachment_key
+from .schemas import (
+    AnalyzeRequest,
+    AnalysisIssue,
+    DocumentRequest,
+    DocumentResponse,
+    Reference,
+)
+from .vector_store import VectorStore
+
+FALLBACK_REFERENCES = [
+    Reference(
+        source="norma",
+        citation="art. 3, comma 1, Codice della Strada",
+        url="https://www.normattiva.it/uri-res/N2Ls?urn:nir:stato:codice.strada:2024-01-01;art=3",
+    )
+]
+
+REFERENCE_TEMPLATES = [
+    Reference(
+        source="giurisprudenza",
+        citation="Corte di Cassazione (giurisprudenza)",
+        url="https://www.giustizia.it/giustizia/it/mg_1_8_1.page",
+    ),
+    Reference(
+        source="policy",
+        citation="Regola interna 5/2025",
+        url="https://example.com/policy/5-2025",
+    ),
+]
+
+REFERENCE_STATE_DIR = os.getenv("REFERENCE_STATE_DIR", "").strip()
+VECTOR_STORE = VectorStore(state_dir=Path(REFERENCE_STATE_DIR) if REFERENCE_STATE_DIR else None)
+
+ATTACHMENT_CACHE_PATH = os.getenv("ATTACHMENT_CACHE_PATH", "").strip()
+ATTACHMENT_CACHE = AttachmentCache(
+    max_entries=int(os.getenv("ATTACHMENT_CACHE_MAX", "2000")),
+    db_path=Path(ATTACHMENT_CACHE_PATH) if ATTACHMENT_CACHE_PATH else None,
+    disk_max_entries=int(os.getenv("ATTACHMENT_CACHE_DISK_MAX", "100000")),
+)
+atexit.register(ATTACHMENT_CACHE.close)
+
+RULES = [
+    {
+        "type": "process",
+        "keywords": ["notifica", "termine", "calendarizzazione"],
+        "issue": "Possibile notifica oltre i termini (da verificare)",
+        "actions": [
+            "Verifica data di infrazione, spedizione e ricezione ufficiale",
+            "Se i termini risultano superati, valuta richiesta di annullamento",
+        ],
+        "confidence": 0.82,
+    },
+    {
+        "type": "substance",
+        "keywords": ["importo", "sanzione", "totale"],
+        "issue": "Importo elevato senza dettaglio sul calcolo",
+        "actions": [
+            "Richiedi il dettaglio del calcolo dell’importo",
+            "Controlla se ci sono sconti o riduzioni automatiche dimenticate",
+        ],
+        "confidence": 0.66,
+    },
+    {
+        "type": "substance",
+        "keywords": ["saldo", "tributo", "recupero"],
+        "issue": "Importo contestato in assenza di dettagli sul calcolo",
+        "actions": [
+            "Chiedi istruzioni scritte sull’importo e sue componenti",
+            "Richiedi un estratto conto firmato dalla prefettura",
+        ],
+        "confidence": 0.55,
+    },
+    {
+        "type": "formality",
+        "keywords": ["ricorso", "istruzioni", "procedura"],
+        "issue": "Mancanza delle istruzioni su come proporre ricorso",
+        "actions": [
+            "Richiedi copia completa del foglietto informativo allegato alla multa",
+            "Prepara scheda da inviare tramite PEC entro 30 giorni",
+        ],
+        "confidence": 0.48,
+    },
+]
+
+RULES_VERSION = hashlib.sha256(
+    json.dumps(
+        [RULES, [ref.model_dump(mode="json") for ref in FALLBACK_REFERENCES + REFERENCE_TEMPLATES]],
+        sort_keys=True,
+    ).encode("utf-8")
+).hexdigest()
+
+
+def extract_entities(text: str) -> Dict[str, str]:
+    import re
+    lowered = text.lower()
+    entities: Dict[str, str] = {}
+    if "art." in lowered:
+        start = lowered.find("art.")
+        end = lowered.find(" ", start + 4)
+        entities["article"] = lowered[start:end].strip(". ,") if end != -1 else lowered[start:].strip(". ,")
+    # Extract year dynamically (202X pattern)
+    year_match = re.search(r"\b(202\d)\b", lowered)
+    if year_match:
+        entities["year"] = year_match.group(1)
+    date_pattern = r"\b(\d{1,2}[\/\-.]\d{1,2}[\/\-.]\d{2,4})\b"
+    for match in re.finditer(date_pattern, lowered):
+        window = lowered[max(0, match.start() - 30): match.end() + 30]
+        if any(k in window for k in ["infrazione", "violazione", "accertamento"]):
+            entities["infraction_date"] = match.group(1)
+        if any(k in window for k in ["notifica", "spedizione", "ricezione", "consegna"]):
+            entities["notification_date"] = match.group(1)
+        if any(k in window for k in ["pagamento", "scadenza", "entro"]):
+            entities.setdefault("payment_deadline", match.group(1))
+    plate_match = re.search(r"\b([a-z]{2}\s?\d{3}\s?[a-z]{2})\b", lowered, re.IGNORECASE)
+    if plate_match:
+        entities["plate"] = plate_match.group(1).replace(" ", "").upper()
+    verbale_match = re.search(
+        r"\bverbale\s*(?:n\.|num\.|numero)?\s*([a-z0-9\/\-]{5,})\b",
+        lowered,
+        re.IGNORECASE,
+    )
+    if verbale_match:
+        entities["verbale_number"] = verbale_match.group(1)
+    if any(k in lowered for k in ["polizia municipale", "polizia locale", "carabinieri", "prefettura", "comune di"]):
+        entities["issuer"] = "present"
+    return entities
+
+
+def is_traffic_fine(text: str) -> bool:
+    lowered = text.lower()
+    keywords = [
+        "verbale",
+        "sanzione amministrativa",
+        "codice della strada",
+        "violazione",
+        "accertamento",
+        "targa",
+        "autovelox",
+        "polizia",
+        "giudice di pace",
+        "prefetto",
+    ]
+    return any(k in lowered for k in keywords)
+
+
+def build_summary(issues: List[AnalysisIssue], payload: AnalyzeRequest) -> Tuple[str, str]:
+    max_confidence = max(issue.confidence for issue in issues)
+    level = (
+        "high"
+        if payload.metadata.amount > 1000 or max_confidence >= 0.7
+        else "medium"
+    )
+    actions = []
+    for issue in issues:
+        actions.extend(issue.actions)
+    metadata_hint = f"({payload.metadata.jurisdiction})"
+    truncated_actions = actions[:3]
+    next_step = " · ".join(truncated_actions) or f"Raccogli più contesto {metadata_hint}"
+    return level, next_step
+
+
+def build_document_text(document_request: DocumentRequest) -> DocumentResponse:
+    title = f"Bozza automatica per {document_request.issue_type.upper()} - {document_request.document_id}"
+    intro = (
+        "Egregi Signori,\n"
+        "in relazione alla notifica ricevuta, l’analisi preliminare dell’agentic AI individua i seguenti punti critici."
+    )
+    actions_block = "\n".join(
+        [f"- {action}" for action in document_request.actions]
+    )
+    references_block = "\n".join(
+        [f"- {ref.citation} ({ref.source})" for ref in document_request.references]
+    )
+    body = (
+        f"{intro}\n\nAzioni suggerite:\n{actions_block}\n\nRiferimenti normativi:\n{references_block}"
+        f"\n\nProssimo passo consigliato: {document_request.summary_next_step}\n"
+    )
+    return DocumentResponse(
+        document_id=document_request.document_id,
+        title=title,
+        body=body,
+        recommendations=[ref.citation for ref in document_request.references],
+    )
+
+
+def extract_content(payload: AnalyzeRequest) -> Extraction:
+    key = attachment_key(payload.attachments or [])
+    # Pick up reference updates written by other workers before keying the cache on the revision.
+    VECTOR_STORE.refresh()
+    store_revision = VECTOR_STORE.revision
+    if key is not None:
+        cached = ATTACHMENT_CACHE.get(key, payload.text, store_revision)
+        if cached is not None:
+            return cached
+    extraction = (
+        extract_entities(payload.text),
+        is_traffic_fine(payload.text),
+        VECTOR_STORE.query(payload.text),
+    )
+    if key is not None:
+        ATTACHMENT_CACHE.put(key, payload.text, extraction, store_revision)
+    return extraction
+
+
+def analyze_text(payload: AnalyzeRequest) -> List[AnalysisIssue]:
+    normalized_text = payload.text.lower()
+    entities, is_fine, matched_references = extract_content(payload)
+    if not matched_references:
+        matched_references = FALLBACK_REFERENCES + REFERENCE_TEMPLATES
+
+    issues: List[AnalysisIssue] = []
+    if is_fine:
+        missing_fields = []
+        if not entities.get("infraction_date"):
+            missing_fields.append("data infrazione")
+        if not entities.get("notification_date"):
+            missing_fields.append("data notifica/spedizione")
+        if not entities.get("verbale_number"):
+            missing_fields.append("numero verbale/protocollo")
+        if not entities.get("plate"):
+            missing_fields.append("targa veicolo")
+        if missing_fields:
+            issues.append(
+                AnalysisIssue(
+                    type="process",
+                    issue=(
+                        "Dati chiave della multa non rilevati: "
+                        + ", ".join(missing_fields)
+                    ),
+                    confidence=0.72,
+                    references=[
+                        Reference(
+                            source="norma",
+                            citation="art. 201, Codice della Strada (notificazione)",
+                            url="https://www.normattiva.it/uri-res/N2Ls?urn:nir:stato:codice.strada:1992-04-30;201",
+                        )
+                    ],
+                    actions=[
+                        "Carica la pagina con intestazione e numero verbale",
+                        "Verifica che le date di infrazione e notifica siano leggibili",
+                        "Se i dati sono presenti, trascrivili nei campi dell’app",
+                    ],
+                )
+            )
+        if entities.get("notification_date") and not entities.get("infraction_date"):
+            issues.append(
+                AnalysisIssue(
+                    type="process",
+                    issue="Data notifica presente ma data infrazione mancante",
+                    confidence=0.6,
+                    references=matched_references[:1],
+                    actions=[
+                        "Individua la data dell’infrazione sul verbale",
+                        "Confronta i tempi tra infrazione e notifica",
+                    ],
+                )
+            )
+
+    for rule in RULES:
+        if any(keyword in normalized_text for keyword in rule["keywords"]):
+            confidence = rule["confidence"]
+            if entities.get("article"):
+                confidence += 0.04
+            references = matched_references[:2]
+            issues.append(
+                AnalysisIssue(
+                    type=rule["type"],
+                    issue=rule["issue"],
+                    confidence=min(confidence, 0.99),
+                    references=references,
+                    actions=rule["actions"],
+                )
+            )
+
+    if payload.metadata.amount > 800 and payload.metadata.jurisdiction.lower() in {"roma", "milano"}:
+        issues.append(
+            AnalysisIssue(
+                type="process",
+                issue="Giurisdizione centrale: valuta la possibilità di richiedere sconto o rateizzazione",
+                confidence=0.65,
+                references=REFERENCE_TEMPLATES[:2],
+                actions=[
+                    "Chiedi visita ufficiale presso la prefettura di competenza",
+                    "Verifica la possibilità di dilazionare l’importo a rate",
+                ],
+            )
+        )
+
+    if payload.metadata.amount > 500 and not any(
+        issue.type == "substance" for issue in issues
+    ):
+        issues.append(
+            AnalysisIssue(
+                type="substance",
+        issue="Importo contestato superiore a 500 senza allegati giustificativi",
+        confidence=0.58,
+        references=matched_references[:2],
+            actions=[
+                "Allega la documentazione contabile che giustifica l’importo",
+                "Richiedi la revisione dei calcoli alla prefettura competente",
+            ],
+        )
+    )
+
+    if payload.attachments:
+        issues.append(
+            AnalysisIssue(
+                type="formality",
+                issue="Documenti allegati: convalida leggibilità e date",
+                confidence=0.6,
+                references=REFERENCE_TEMPLATES[:1],
+                actions=[
+                    "Assicurati che ogni possibile allegato contenga i riferimenti temporali richiesti",
+                    "Conferma che i PDF siano testuali e non immagini sfocate",
+                ],
+            )
+        )
+
+    if not issues:
+        issues.append(
+            AnalysisIssue(
+                type="formality",
+                issue="Analisi preliminare: serve maggior contesto",
+                confidence=0.30,
+                references=FALLBACK_REFERENCES,
+                actions=[
+                    "Chiedi all’utente di caricare la notifica/scansione originale",
+                    "Assicurati di avere i dati di notifica e il calendario della sanzione",
+                ],
+            )
+        )
+
+    return issues
@@ -0,0 +1,73 @@
+import gzip
+import hashlib
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:  # brotli is optional: without it only gzip is negotiated
+    brotli = None
+
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compute_etag(path: str, body: bytes, *versions: str, weak: bool = False) -> str:
+    digest = hashlib.sha256()
+    for part in (path, *versions):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    digest.update(body)
+    # Weak when the same request may yield different bytes (e.g. a server timestamp in the body).
+    return f'{"W/" if weak else ""}"{digest.hexdigest()[:32]}"'
+
+
+def representation_etag(etag: str, encoding: Optional[str]) -> str:
+    """ETag della rappresentazione codificata: gzip e br hanno byte diversi, quindi tag diversi."""
+    if encoding is None:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    # If-None-Match uses weak comparison: a W/ prefix on either side does not prevent a match.
+    # "*" is ignored: it only makes sense for GET/HEAD, while these responses answer a POST body.
+    opaque = etag.removeprefix("W/")
+    return any(candidate.removeprefix("W/") == opaque for candidate in candidates)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    ranked = [
+        encoding
+        for encoding in SUPPORTED_ENCODINGS
+        if weights.get(encoding, weights.get("*", 0.0)) > 0
+    ]
+    if not ranked:
+        return None
+    return max(ranked, key=lambda encoding: weights.get(encoding, weights.get("*", 0.0)))
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def decompress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.decompress(body)
+    return gzip.decompress(body)
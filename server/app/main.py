@@ -1,31 +1,47 @@
+import asyncio
+import atexit
+import hashlib
+import hmac
 import json
 import logging
 from logging.handlers import TimedRotatingFileHandler
 import os
+import random
+import tempfile
+import time
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
 
 from dotenv import load_dotenv
 from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from .admission import AdmissionLane
+from .engine import RULES_VERSION, VECTOR_STORE, analyze_text, build_document_text, build_summary
+from .http_cache import compress, compute_etag, decompress, etag_matches, negotiate_encoding, representation_etag
+from .profiling import ProfileStore, RequestProfile, activate, deactivate, profiled
+from .replay_cache import ReplayCache
+from .result_store import ResultStore
 from .schemas import (
     AnalyzeRequest,
     AnalyzeResponse,
-    AnalysisIssue,
     DocumentRequest,
     DocumentResponse,
-    Reference,
+    ReferenceRecord,
     Summary,
 )
-from .vector_store import VectorStore
+from .tiered_cache import TieredCache
 
 BASE_DIR = Path(__file__).resolve().parents[1]
 DOTENV_PATH = BASE_DIR.parent / ".env"
 load_dotenv(DOTENV_PATH)
 
 API_TOKEN = os.getenv("BACKEND_API_TOKEN", "changeme")
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "").strip()
 ALLOWED_ORIGINS = [
     origin.strip()
     for origin in os.getenv(
@@ -63,6 +79,73 @@ def check_rate_limit(user_id: str) -> None:
     _rate_limit_store[key]["count"] += 1
 
 
+# Conditional responses (ETag / If-None-Match) and negotiated compression
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# /generate-document is a pure function of its payload: large compressed bodies are reused by ETag.
+PRECOMPRESSED_ROUTES = {"/generate-document"}
+# /analyze bodies carry server_time, so equal requests are only semantically equivalent
+WEAK_ETAG_ROUTES = {"/analyze"}
+PRECOMPRESSED_CACHE = TieredCache("precompressed", max_entries=int(os.getenv("PRECOMPRESSED_CACHE_MAX", "256")))
+
+# Reference store: every process follows the shared WAL; only the leader process compacts it
+VECTOR_STORE.start_background_compaction(
+    interval=float(os.getenv("REFERENCE_COMPACTION_INTERVAL", "300")),
+    min_ops=int(os.getenv("REFERENCE_COMPACTION_MIN_OPS", "1")),
+)
+atexit.register(VECTOR_STORE.compact)
+
+# On-demand profiling: `Profile-Token: <ADMIN_API_TOKEN>` header or random sampling
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_STORE = ProfileStore(
+    Path(os.getenv("PROFILE_DIR", "").strip() or Path(tempfile.gettempdir()) / "bureaucracy-agent-profiles"),
+    max_profiles=int(os.getenv("PROFILE_MAX_FILES", "100")),
+)
+
+
+# Admission control: bounded in-flight work and wait queue per heavy endpoint.
+# Paths without a lane (e.g. /health) are never queued behind them.
+def _admission_lane(name: str, path: str, default_max_in_flight: int) -> AdmissionLane:
+    prefix = f"ADMISSION_{name.upper()}"
+    return AdmissionLane(
+        path,
+        max_in_flight=int(os.getenv(f"{prefix}_MAX_IN_FLIGHT", str(default_max_in_flight))),
+        max_queue=int(os.getenv(f"{prefix}_MAX_QUEUE", "32")),
+        queue_timeout=int(os.getenv(f"{prefix}_QUEUE_TIMEOUT_MS", "2000")) / 1000,
+    )
+
+
+ADMISSION_LANES: Dict[str, AdmissionLane] = {
+    "/analyze": _admission_lane("analyze", "/analyze", os.cpu_count() or 1),
+    "/generate-document": _admission_lane("document", "/generate-document", 2 * (os.cpu_count() or 1)),
+}
+
+
+# Idempotency: completed responses replayed by (user_id, Request-Id)
+REPLAY_CACHE_PATH = os.getenv("REPLAY_CACHE_PATH", "").strip()
+REPLAY_CACHE = ReplayCache(
+    max_entries=int(os.getenv("REPLAY_CACHE_MAX", "1000")),
+    db_path=Path(REPLAY_CACHE_PATH) if REPLAY_CACHE_PATH else None,
+    disk_max_entries=int(os.getenv("REPLAY_CACHE_DISK_MAX", "100000")),
+)
+atexit.register(REPLAY_CACHE.close)
+# Requests still executing per (user_id, Request-Id): concurrent duplicates wait on them
+REPLAY_IN_FLIGHT: Dict[Tuple[str, str], Tuple[str, "asyncio.Future[None]"]] = {}
+# Optional persistence of analysis/document results for offline analytics
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH", "").strip()
+RESULT_STORE: Optional[ResultStore] = None
+if RESULT_STORE_PATH:
+    RESULT_STORE = ResultStore(
+        Path(RESULT_STORE_PATH),
+        batch_size=int(os.getenv("RESULT_STORE_BATCH_SIZE", "200")),
+    )
+    atexit.register(RESULT_STORE.close)
+
+IDEMPOTENT_ROUTES: Dict[str, Tuple[str, ...]] = {
+    "/analyze": ("metadata", "user_id"),
+    "/generate-document": ("user_id",),
+}
+
+
 app = FastAPI(
     title="Bureaucracy Agent Brain",
     description="Endpoint protetto che analizza testi di infrazioni attraverso regole e un vector DB delle norme.",
@@ -113,329 +196,238 @@ def verify_token(authorization: Optional[str] = Header(None)):
     return token
 
 
+def verify_admin_token(authorization: Optional[str] = Header(None)):
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="API amministrativa disabilitata")
+    if not authorization or not hmac.compare_digest(authorization.encode(), f"Bearer {ADMIN_API_TOKEN}".encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token amministrativo non valido")
+    return ADMIN_API_TOKEN
+
+
 def require_request_id(request_id: str = Header(None, alias="Request-Id")) -> str:
     if not request_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Request-Id mancante")
     return request_id
 
 
+def _extract_user_id(body: bytes, field_path: Tuple[str, ...]) -> Optional[str]:
+    try:
+        value: Any = json.loads(body)
+    except ValueError:
+        return None
+    for field in field_path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(field)
+    return value if isinstance(value, str) and value else None
+
+
 @app.middleware("http")
-async def log_request(request: Request, call_next):
-    request_id = request.headers.get("Request-Id", "unknown")
-    logger.info(
-        json.dumps(
-            {
-                "event": "request.start",
-                "method": request.method,
-                "path": request.url.path,
-                "request_id": request_id,
-            }
+async def admission_control(request: Request, call_next):
+    lane = ADMISSION_LANES.get(request.url.path)
+    if lane is None or request.method != "POST":
+        return await call_next(request)
+    if not await lane.acquire():
+        logger.info(
+            json.dumps(
+                {
+                    "event": "admission.rejected",
+                    "path": request.url.path,
+                    "request_id": request.headers.get("Request-Id", "unknown"),
+                    "in_flight": lane.in_flight,
+                    "queued": lane.queued,
+                }
+            )
         )
-    )
-    response: Response = await call_next(request)
-    logger.info(
-        json.dumps(
-            {
-                "event": "request.end",
-                "status_code": response.status_code,
-                "request_id": request_id,
-            }
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Servizio momentaneamente sovraccarico, riprova più tardi"},
+            headers={"Retry-After": str(lane.retry_after())},
         )
-    )
-    return response
+    started = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        lane.release(time.perf_counter() - started)
 
 
-FALLBACK_REFERENCES = [
-    Reference(
-        source="norma",
-        citation="art. 3, comma 1, Codice della Strada",
-        url="https://www.normattiva.it/uri-res/N2Ls?urn:nir:stato:codice.strada:2024-01-01;art=3",
+@app.middleware("http")
+async def replay_idempotent(request: Request, call_next):
+    field_path = IDEMPOTENT_ROUTES.get(request.url.path)
+    request_id = request.headers.get("Request-Id")
+    if request.method != "POST" or field_path is None or not request_id:
+        return await call_next(request)
+    try:
+        verify_token(request.headers.get("Authorization"))
+    except HTTPException:
+        return await call_next(request)
+    body = await request.body()
+    user_id = _extract_user_id(body, field_path)
+    if user_id is None:
+        return await call_next(request)
+
+    fingerprint = hashlib.sha256(body).hexdigest()
+    key = (user_id, request_id)
+    while True:
+        if REPLAY_CACHE.persistent:
+            # A memory miss falls through to SQLite: keep that read off the event loop.
+            cached = await run_in_threadpool(REPLAY_CACHE.get, user_id, request_id)
+        else:
+            cached = REPLAY_CACHE.get(user_id, request_id)
+        if cached is not None:
+            cached_fingerprint, content = cached
+            if cached_fingerprint != fingerprint:
+                return _replay_conflict()
+            return Response(
+                content=content,
+                media_type="application/json",
+                headers={"Idempotent-Replayed": "true"},
+            )
+        in_flight = REPLAY_IN_FLIGHT.get(key)
+        if in_flight is None:
+            break
+        in_flight_fingerprint, done = in_flight
+        if in_flight_fingerprint != fingerprint:
+            return _replay_conflict()
+        # A duplicate arriving while the first attempt runs waits for its outcome instead of
+        # executing twice; if the first attempt fails nothing is cached and the loop takes over.
+        await asyncio.shield(done)
+
+    done = asyncio.get_running_loop().create_future()
+    REPLAY_IN_FLIGHT[key] = (fingerprint, done)
+    try:
+        response: Response = await call_next(request)
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        content = b"".join([chunk async for chunk in response.body_iterator])
+        REPLAY_CACHE.put(user_id, request_id, fingerprint, content)
+    finally:
+        del REPLAY_IN_FLIGHT[key]
+        done.set_result(None)
+    return Response(
+        content=content,
+        status_code=response.status_code,
+        headers=dict(response.headers),
     )
-]
 
-REFERENCE_TEMPLATES = [
-    Reference(
-        source="giurisprudenza",
-        citation="Corte di Cassazione (giurisprudenza)",
-        url="https://www.giustizia.it/giustizia/it/mg_1_8_1.page",
-    ),
-    Reference(
-        source="policy",
-        citation="Regola interna 5/2025",
-        url="https://example.com/policy/5-2025",
-    ),
-]
-
-VECTOR_STORE = VectorStore()
-
-RULES = [
-    {
-        "type": "process",
-        "keywords": ["notifica", "termine", "calendarizzazione"],
-        "issue": "Possibile notifica oltre i termini (da verificare)",
-        "actions": [
-            "Verifica data di infrazione, spedizione e ricezione ufficiale",
-            "Se i termini risultano superati, valuta richiesta di annullamento",
-        ],
-        "confidence": 0.82,
-    },
-    {
-        "type": "substance",
-        "keywords": ["importo", "sanzione", "totale"],
-        "issue": "Importo elevato senza dettaglio sul calcolo",
-        "actions": [
-            "Richiedi il dettaglio del calcolo dell’importo",
-            "Controlla se ci sono sconti o riduzioni automatiche dimenticate",
-        ],
-        "confidence": 0.66,
-    },
-    {
-        "type": "substance",
-        "keywords": ["saldo", "tributo", "recupero"],
-        "issue": "Importo contestato in assenza di dettagli sul calcolo",
-        "actions": [
-            "Chiedi istruzioni scritte sull’importo e sue componenti",
-            "Richiedi un estratto conto firmato dalla prefettura",
-        ],
-        "confidence": 0.55,
-    },
-    {
-        "type": "formality",
-        "keywords": ["ricorso", "istruzioni", "procedura"],
-        "issue": "Mancanza delle istruzioni su come proporre ricorso",
-        "actions": [
-            "Richiedi copia completa del foglietto informativo allegato alla multa",
-            "Prepara scheda da inviare tramite PEC entro 30 giorni",
-        ],
-        "confidence": 0.48,
-    },
-]
 
-
-def extract_entities(text: str) -> Dict[str, str]:
-    import re
-    lowered = text.lower()
-    entities: Dict[str, str] = {}
-    if "art." in lowered:
-        start = lowered.find("art.")
-        end = lowered.find(" ", start + 4)
-        entities["article"] = lowered[start:end].strip(". ,") if end != -1 else lowered[start:].strip(". ,")
-    # Extract year dynamically (202X pattern)
-    year_match = re.search(r"\b(202\d)\b", lowered)
-    if year_match:
-        entities["year"] = year_match.group(1)
-    date_pattern = r"\b(\d{1,2}[\/\-.]\d{1,2}[\/\-.]\d{2,4})\b"
-    for match in re.finditer(date_pattern, lowered):
-        window = lowered[max(0, match.start() - 30): match.end() + 30]
-        if any(k in window for k in ["infrazione", "violazione", "accertamento"]):
-            entities["infraction_date"] = match.group(1)
-        if any(k in window for k in ["notifica", "spedizione", "ricezione", "consegna"]):
-            entities["notification_date"] = match.group(1)
-        if any(k in window for k in ["pagamento", "scadenza", "entro"]):
-            entities.setdefault("payment_deadline", match.group(1))
-    plate_match = re.search(r"\b([a-z]{2}\s?\d{3}\s?[a-z]{2})\b", lowered, re.IGNORECASE)
-    if plate_match:
-        entities["plate"] = plate_match.group(1).replace(" ", "").upper()
-    verbale_match = re.search(
-        r"\bverbale\s*(?:n\.|num\.|numero)?\s*([a-z0-9\/\-]{5,})\b",
-        lowered,
-        re.IGNORECASE,
-    )
-    if verbale_match:
-        entities["verbale_number"] = verbale_match.group(1)
-    if any(k in lowered for k in ["polizia municipale", "polizia locale", "carabinieri", "prefettura", "comune di"]):
-        entities["issuer"] = "present"
-    return entities
-
-
-def is_traffic_fine(text: str) -> bool:
-    lowered = text.lower()
-    keywords = [
-        "verbale",
-        "sanzione amministrativa",
-        "codice della strada",
-        "violazione",
-        "accertamento",
-        "targa",
-        "autovelox",
-        "polizia",
-        "giudice di pace",
-        "prefetto",
-    ]
-    return any(k in lowered for k in keywords)
-
-
-def build_summary(issues: List[AnalysisIssue], payload: AnalyzeRequest) -> Tuple[str, str]:
-    max_confidence = max(issue.confidence for issue in issues)
-    level = (
-        "high"
-        if payload.metadata.amount > 1000 or max_confidence >= 0.7
-        else "medium"
-    )
-    actions = []
-    for issue in issues:
-        actions.extend(issue.actions)
-    metadata_hint = f"({payload.metadata.jurisdiction})"
-    truncated_actions = actions[:3]
-    next_step = " · ".join(truncated_actions) or f"Raccogli più contesto {metadata_hint}"
-    return level, next_step
-
-
-def build_document_text(document_request: DocumentRequest) -> DocumentResponse:
-    title = f"Bozza automatica per {document_request.issue_type.upper()} - {document_request.document_id}"
-    intro = (
-        "Egregi Signori,\n"
-        "in relazione alla notifica ricevuta, l’analisi preliminare dell’agentic AI individua i seguenti punti critici."
+def _replay_conflict() -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_409_CONFLICT,
+        content={"detail": "Request-Id già utilizzato con un payload diverso"},
     )
-    actions_block = "\n".join(
-        [f"- {action}" for action in document_request.actions]
-    )
-    references_block = "\n".join(
-        [f"- {ref.citation} ({ref.source})" for ref in document_request.references]
-    )
-    body = (
-        f"{intro}\n\nAzioni suggerite:\n{actions_block}\n\nRiferimenti normativi:\n{references_block}"
-        f"\n\nProssimo passo consigliato: {document_request.summary_next_step}\n"
-    )
-    return DocumentResponse(
-        document_id=document_request.document_id,
-        title=title,
-        body=body,
-        recommendations=[ref.citation for ref in document_request.references],
-    )
-
 
-def analyze_text(payload: AnalyzeRequest) -> List[AnalysisIssue]:
-    normalized_text = payload.text.lower()
-    entities = extract_entities(payload.text)
-    is_fine = is_traffic_fine(payload.text)
-    matched_references = VECTOR_STORE.query(payload.text)
-    if not matched_references:
-        matched_references = FALLBACK_REFERENCES + REFERENCE_TEMPLATES
-
-    issues: List[AnalysisIssue] = []
-    if is_fine:
-        missing_fields = []
-        if not entities.get("infraction_date"):
-            missing_fields.append("data infrazione")
-        if not entities.get("notification_date"):
-            missing_fields.append("data notifica/spedizione")
-        if not entities.get("verbale_number"):
-            missing_fields.append("numero verbale/protocollo")
-        if not entities.get("plate"):
-            missing_fields.append("targa veicolo")
-        if missing_fields:
-            issues.append(
-                AnalysisIssue(
-                    type="process",
-                    issue=(
-                        "Dati chiave della multa non rilevati: "
-                        + ", ".join(missing_fields)
-                    ),
-                    confidence=0.72,
-                    references=[
-                        Reference(
-                            source="norma",
-                            citation="art. 201, Codice della Strada (notificazione)",
-                            url="https://www.normattiva.it/uri-res/N2Ls?urn:nir:stato:codice.strada:1992-04-30;201",
-                        )
-                    ],
-                    actions=[
-                        "Carica la pagina con intestazione e numero verbale",
-                        "Verifica che le date di infrazione e notifica siano leggibili",
-                        "Se i dati sono presenti, trascrivili nei campi dell’app",
-                    ],
-                )
-            )
-        if entities.get("notification_date") and not entities.get("infraction_date"):
-            issues.append(
-                AnalysisIssue(
-                    type="process",
-                    issue="Data notifica presente ma data infrazione mancante",
-                    confidence=0.6,
-                    references=matched_references[:1],
-                    actions=[
-                        "Individua la data dell’infrazione sul verbale",
-                        "Confronta i tempi tra infrazione e notifica",
-                    ],
-                )
-            )
 
-    for rule in RULES:
-        if any(keyword in normalized_text for keyword in rule["keywords"]):
-            confidence = rule["confidence"]
-            if entities.get("article"):
-                confidence += 0.04
-            references = matched_references[:2]
-            issues.append(
-                AnalysisIssue(
-                    type=rule["type"],
-                    issue=rule["issue"],
-                    confidence=min(confidence, 0.99),
-                    references=references,
-                    actions=rule["actions"],
-                )
+@app.middleware("http")
+async def conditional_response(request: Request, call_next):
+    request_id = request.headers.get("Request-Id")
+    # Without a Request-Id the route rejects the request: never answer it from a cache.
+    if request.method != "POST" or request.url.path not in IDEMPOTENT_ROUTES or not request_id:
+        return await call_next(request)
+    try:
+        verify_token(request.headers.get("Authorization"))
+    except HTTPException:
+        return await call_next(request)
+    body = await request.body()
+    if VECTOR_STORE.needs_refresh():
+        await run_in_threadpool(VECTOR_STORE.refresh)
+    etag = compute_etag(
+        request.url.path,
+        body,
+        app.version,
+        RULES_VERSION,
+        VECTOR_STORE.revision,
+        weak=request.url.path in WEAK_ETAG_ROUTES,
+    )
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+    encoded_etag = representation_etag(etag, encoding)
+    if_none_match = request.headers.get("If-None-Match")
+    for candidate in dict.fromkeys((etag, encoded_etag)):
+        if etag_matches(if_none_match, candidate):
+            # The client already holds this body: nothing new to archive.
+            logger.info(json.dumps({"event": "request.not_modified", "request_id": request_id, "path": request.url.path}))
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED,
+                headers={"ETag": candidate, "Vary": "Accept-Encoding"},
             )
 
-    if payload.metadata.amount > 800 and payload.metadata.jurisdiction.lower() in {"roma", "milano"}:
-        issues.append(
-            AnalysisIssue(
-                type="process",
-                issue="Giurisdizione centrale: valuta la possibilità di richiedere sconto o rateizzazione",
-                confidence=0.65,
-                references=REFERENCE_TEMPLATES[:2],
-                actions=[
-                    "Chiedi visita ufficiale presso la prefettura di competenza",
-                    "Verifica la possibilità di dilazionare l’importo a rate",
-                ],
+    precompressed = request.url.path in PRECOMPRESSED_ROUTES and encoding is not None
+    if precompressed:
+        cached = PRECOMPRESSED_CACHE.get(encoded_etag)
+        if cached is not None:
+            _record_cached_document(request_id, body, cached, encoding)
+            return Response(
+                content=cached,
+                media_type="application/json",
+                headers={"ETag": encoded_etag, "Content-Encoding": encoding, "Vary": "Accept-Encoding"},
             )
-        )
 
-    if payload.metadata.amount > 500 and not any(
-        issue.type == "substance" for issue in issues
-    ):
-        issues.append(
-            AnalysisIssue(
-                type="substance",
-        issue="Importo contestato superiore a 500 senza allegati giustificativi",
-        confidence=0.58,
-        references=matched_references[:2],
-            actions=[
-                "Allega la documentazione contabile che giustifica l’importo",
-                "Richiedi la revisione dei calcoli alla prefettura competente",
-            ],
-        )
+    response: Response = await call_next(request)
+    if response.status_code != status.HTTP_200_OK:
+        return response
+    content = b"".join([chunk async for chunk in response.body_iterator])
+    headers = {key: value for key, value in response.headers.items() if key.lower() != "content-length"}
+    headers["ETag"] = etag
+    headers["Vary"] = "Accept-Encoding"
+    if encoding is not None and len(content) >= COMPRESSION_MIN_SIZE:
+        content = compress(content, encoding)
+        headers["ETag"] = encoded_etag
+        headers["Content-Encoding"] = encoding
+        if precompressed:
+            PRECOMPRESSED_CACHE.put(encoded_etag, content)
+    return Response(content=content, status_code=response.status_code, headers=headers)
+
+
+def _record_cached_document(request_id: str, body: bytes, cached: bytes, encoding: str) -> None:
+    document = DocumentResponse.model_validate_json(decompress(cached, encoding))
+    logger.info(
+        json.dumps({"event": "document.cached", "request_id": request_id, "document_id": document.document_id})
     )
+    if RESULT_STORE is not None:
+        user_id = json.loads(body).get("user_id", "")
+        RESULT_STORE.record("document", request_id, user_id, document.document_id, None, document)
 
-    if payload.attachments:
-        issues.append(
-            AnalysisIssue(
-                type="formality",
-                issue="Documenti allegati: convalida leggibilità e date",
-                confidence=0.6,
-                references=REFERENCE_TEMPLATES[:1],
-                actions=[
-                    "Assicurati che ogni possibile allegato contenga i riferimenti temporali richiesti",
-                    "Conferma che i PDF siano testuali e non immagini sfocate",
-                ],
-            )
-        )
 
-    if not issues:
-        issues.append(
-            AnalysisIssue(
-                type="formality",
-                issue="Analisi preliminare: serve maggior contesto",
-                confidence=0.30,
-                references=FALLBACK_REFERENCES,
-                actions=[
-                    "Chiedi all’utente di caricare la notifica/scansione originale",
-                    "Assicurati di avere i dati di notifica e il calendario della sanzione",
-                ],
-            )
+@app.middleware("http")
+async def log_request(request: Request, call_next):
+    request_id = request.headers.get("Request-Id", "unknown")
+    logger.info(
+        json.dumps(
+            {
+                "event": "request.start",
+                "method": request.method,
+                "path": request.url.path,
+                "request_id": request_id,
+            }
         )
+    )
+    profile = RequestProfile() if _should_profile(request) else None
+    profile_token = activate(profile) if profile is not None else None
+    try:
+        response: Response = await call_next(request)
+    finally:
+        if profile_token is not None:
+            deactivate(profile_token)
+    end_record: Dict[str, Any] = {
+        "event": "request.end",
+        "status_code": response.status_code,
+        "request_id": request_id,
+    }
+    if profile is not None and profile.stacks:
+        await run_in_threadpool(PROFILE_STORE.save, request_id, profile)
+        # Link to the admin endpoint rather than the server filesystem layout.
+        end_record["profile"] = f"/profiles/{quote(request_id, safe='')}"
+    logger.info(json.dumps(end_record))
+    return response
+
 
-    return issues
+def _should_profile(request: Request) -> bool:
+    if "Request-Id" not in request.headers:
+        return False
+    profile_header = request.headers.get("Profile-Token")
+    if profile_header is not None:
+        return bool(ADMIN_API_TOKEN) and hmac.compare_digest(profile_header.encode(), ADMIN_API_TOKEN.encode())
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
 
 
 @app.post("/analyze", response_model=AnalyzeResponse, status_code=status.HTTP_200_OK)
@@ -457,8 +449,8 @@ async def analyze(
         )
     )
 
-    issues = analyze_text(payload)
-    risk_level, next_step = build_summary(issues, payload)
+    issues = await run_in_threadpool(profiled, analyze_text, payload)
+    risk_level, next_step = profiled(build_summary, issues, payload)
     response_payload = AnalyzeResponse(
         document_id=payload.document_id,
         results=issues,
@@ -479,6 +471,15 @@ async def analyze(
             }
         )
     )
+    if RESULT_STORE is not None:
+        RESULT_STORE.record(
+            "analysis",
+            request_id,
+            payload.metadata.user_id,
+            payload.document_id,
+            payload.metadata.jurisdiction,
+            response_payload,
+        )
     return response_payload
 
 
@@ -498,7 +499,7 @@ async def generate_document(
             }
         )
     )
-    document = build_document_text(payload)
+    document = profiled(build_document_text, payload)
     logger.info(
         json.dumps(
             {
@@ -508,8 +509,67 @@ async def generate_document(
             }
         )
     )
+    if RESULT_STORE is not None:
+        RESULT_STORE.record("document", request_id, payload.user_id, payload.document_id, None, document)
     return document
 
+
+@app.get("/results/export")
+async def export_results(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    user_id: Optional[str] = None,
+    document_id: Optional[str] = None,
+    jurisdiction: Optional[str] = None,
+    kind: Optional[str] = None,
+    token: str = Depends(verify_admin_token),
+):
+    if RESULT_STORE is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Archivio risultati non configurato")
+    lines = RESULT_STORE.export(
+        since=since,
+        until=until,
+        user_id=user_id,
+        document_id=document_id,
+        jurisdiction=jurisdiction.strip().title() if jurisdiction else None,
+        kind=kind,
+    )
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+@app.put("/admin/references")
+async def upsert_references(
+    records: List[ReferenceRecord],
+    token: str = Depends(verify_admin_token),
+):
+    entries = [record.model_dump(mode="json") for record in records]
+    try:
+        upserted = await run_in_threadpool(VECTOR_STORE.upsert, *entries)
+    except PermissionError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Archivio norme in sola lettura")
+    logger.info(json.dumps({"event": "references.upserted", "count": upserted, "version": VECTOR_STORE.version}))
+    return {"upserted": upserted, "total": len(VECTOR_STORE), "version": VECTOR_STORE.version}
+
+
+@app.delete("/admin/references/{record_id}")
+async def delete_reference(record_id: str, token: str = Depends(verify_admin_token)):
+    try:
+        deleted = await run_in_threadpool(VECTOR_STORE.delete, record_id)
+    except PermissionError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Archivio norme in sola lettura")
+    if not deleted:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Riferimento non trovato")
+    logger.info(json.dumps({"event": "references.deleted", "id": record_id, "version": VECTOR_STORE.version}))
+    return {"deleted": deleted, "total": len(VECTOR_STORE), "version": VECTOR_STORE.version}
+
+
+@app.get("/profiles/{request_id}", response_class=PlainTextResponse)
+async def get_profile(request_id: str, token: str = Depends(verify_admin_token)):
+    collapsed = PROFILE_STORE.load(request_id)
+    if collapsed is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profilo non trovato")
+    return collapsed
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok", "component": "brain", "server_time": datetime.now(timezone.utc).isoformat()}
@@ -0,0 +1,105 @@
+import hashlib
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar, Token
+from pathlib import Path
+from typing import Any, Callable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+_ACTIVE_PROFILE: "ContextVar[Optional[RequestProfile]]" = ContextVar("active_profile", default=None)
+
+
+class RequestProfile:
+    """Stack collassati (formato flamegraph.pl/speedscope) raccolti durante una richiesta."""
+
+    def __init__(self) -> None:
+        self.stacks: "Counter[str]" = Counter()
+        self._lock = threading.Lock()
+
+    def merge(self, stacks: "Counter[str]") -> None:
+        with self._lock:
+            self.stacks.update(stacks)
+
+    def collapsed(self) -> str:
+        # Weights are microseconds of self time spent in each stack.
+        lines = [f"{stack} {weight // 1000}" for stack, weight in sorted(self.stacks.items()) if weight >= 1000]
+        return "\n".join(lines) + "\n"
+
+
+class _StackTracer:
+    def __init__(self) -> None:
+        self.stacks: "Counter[str]" = Counter()
+        self._stack: List[str] = []
+        self._last = time.perf_counter_ns()
+
+    def callback(self, frame: Any, event: str, arg: Any) -> None:
+        now = time.perf_counter_ns()
+        if self._stack:
+            self.stacks[";".join(self._stack)] += now - self._last
+        if event == "call":
+            code = frame.f_code
+            location = "/".join(Path(code.co_filename).parts[-2:])
+            self._stack.append(f"{code.co_name} ({location}:{code.co_firstlineno})")
+        elif event == "c_call":
+            self._stack.append(getattr(arg, "__qualname__", getattr(arg, "__name__", "?")))
+        elif self._stack:
+            self._stack.pop()
+        self._last = now
+
+
+def activate(profile: RequestProfile) -> "Token[Optional[RequestProfile]]":
+    return _ACTIVE_PROFILE.set(profile)
+
+
+def deactivate(token: "Token[Optional[RequestProfile]]") -> None:
+    _ACTIVE_PROFILE.reset(token)
+
+
+def profiled(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Esegue `func` tracciandone gli stack se la richiesta corrente è profilata."""
+    profile = _ACTIVE_PROFILE.get()
+    if profile is None:
+        return func(*args, **kwargs)
+    tracer = _StackTracer()
+    previous = sys.getprofile()
+    sys.setprofile(tracer.callback)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.setprofile(previous)
+        profile.merge(tracer.stacks)
+
+
+class ProfileStore:
+    """Ring su disco dei profili, indicizzati per Request-Id: oltre `max_profiles` elimina i più vecchi."""
+
+    def __init__(self, directory: Path, max_profiles: int = 100):
+        self.directory = Path(directory)
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    def path_for(self, request_id: str) -> Path:
+        # The sanitised prefix is only for humans: the digest keeps distinct ids in distinct files.
+        readable = re.sub(r"[^A-Za-z0-9._-]", "_", request_id)[:64]
+        digest = hashlib.sha256(request_id.encode("utf-8")).hexdigest()[:32]
+        return self.directory / f"{readable}-{digest}.collapsed"
+
+    def save(self, request_id: str, profile: RequestProfile) -> Path:
+        path = self.path_for(request_id)
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path.write_text(profile.collapsed(), encoding="utf-8")
+            profiles = sorted(self.directory.glob("*.collapsed"), key=lambda item: item.stat().st_mtime)
+            for stale in profiles[: max(0, len(profiles) - self.max_profiles)]:
+                stale.unlink(missing_ok=True)
+        return path
+
+    def load(self, request_id: str) -> Optional[str]:
+        path = self.path_for(request_id)
+        if not path.exists():
+            return None
+        return path.read_text(encoding="utf-8")
@@ -0,0 +1,48 @@
+from pathlib import Path
+from typing import Optional, Tuple
+
+from .tiered_cache import TieredCache
+
+CacheEntry = Tuple[str, bytes]
+
+
+class ReplayCache:
+    """Risposte già serializzate indicizzate per (user_id, Request-Id)."""
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        db_path: Optional[Path] = None,
+        disk_max_entries: int = 100000,
+    ):
+        self._cache = TieredCache("replay", max_entries, db_path, disk_max_entries)
+
+    def get(self, user_id: str, request_id: str) -> Optional[CacheEntry]:
+        raw = self._cache.get(_key(user_id, request_id))
+        if raw is None:
+            return None
+        fingerprint, _, body = raw.partition(b"\n")
+        return fingerprint.decode("ascii"), body
+
+    def put(self, user_id: str, request_id: str, fingerprint: str, body: bytes) -> None:
+        self._cache.put(_key(user_id, request_id), fingerprint.encode("ascii") + b"\n" + body)
+
+    @property
+    def persistent(self) -> bool:
+        return self._cache.persistent
+
+    def flush(self) -> None:
+        self._cache.flush()
+
+    def close(self) -> None:
+        self._cache.close()
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+def _key(user_id: str, request_id: str) -> str:
+    return f"{user_id}\x00{request_id}"
@@ -0,0 +1,237 @@
+import argparse
+import json
+import logging
+import queue
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+logger = logging.getLogger("bureaucracy_agent_brain")
+
+_STOP = object()
+
+EXPORT_COLUMNS = (
+    "id",
+    "kind",
+    "request_id",
+    "user_id",
+    "document_id",
+    "jurisdiction",
+    "created_at",
+)
+
+
+class ResultStore:
+    """Archivio SQLite dei risultati, scritto in batch da un thread dedicato."""
+
+    def __init__(self, db_path: Path, batch_size: int = 200, max_pending: int = 10000):
+        self.db_path = Path(db_path)
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_pending)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "kind TEXT NOT NULL, "
+            "request_id TEXT NOT NULL, "
+            "user_id TEXT NOT NULL, "
+            "document_id TEXT NOT NULL, "
+            "jurisdiction TEXT, "
+            "created_at TEXT NOT NULL, "
+            "result TEXT NOT NULL)"
+        )
+        for column in ("user_id", "document_id", "jurisdiction", "created_at"):
+            conn.execute(f"CREATE INDEX IF NOT EXISTS results_{column} ON results ({column})")
+        conn.commit()
+        conn.close()
+        self._writer = threading.Thread(target=self._run, name="result-store-writer", daemon=True)
+        self._writer.start()
+
+    def record(
+        self,
+        kind: str,
+        request_id: str,
+        user_id: str,
+        document_id: str,
+        jurisdiction: Optional[str],
+        result: BaseModel,
+    ) -> None:
+        created_at = datetime.now(timezone.utc).isoformat()
+        try:
+            self._queue.put_nowait((kind, request_id, user_id, document_id, jurisdiction, created_at, result))
+        except queue.Full:
+            logger.warning(
+                json.dumps({"event": "result_store.dropped", "request_id": request_id, "document_id": document_id})
+            )
+
+    def flush(self) -> None:
+        self._queue.join()
+
+    def close(self) -> None:
+        if not self._writer.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def export(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        user_id: Optional[str] = None,
+        document_id: Optional[str] = None,
+        jurisdiction: Optional[str] = None,
+        kind: Optional[str] = None,
+        page_size: int = 1000,
+    ) -> Iterator[str]:
+        return export_results(
+            self.db_path,
+            since=since,
+            until=until,
+            user_id=user_id,
+            document_id=document_id,
+            jurisdiction=jurisdiction,
+            kind=kind,
+            page_size=page_size,
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _run(self) -> None:
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            batch: List[Tuple[Any, ...]] = []
+            item = self._queue.get()
+            while True:
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if stopping or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                self._write(conn, batch)
+            finally:
+                for _ in range(len(batch) + (1 if stopping else 0)):
+                    self._queue.task_done()
+        conn.close()
+
+    def _write(self, conn: sqlite3.Connection, batch: List[Tuple[Any, ...]]) -> None:
+        if not batch:
+            return
+        rows = [(*item[:-1], item[-1].model_dump_json()) for item in batch]
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO results (kind, request_id, user_id, document_id, jurisdiction, created_at, result) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+        except sqlite3.Error as exc:
+            logger.warning(f"ResultStore: scrittura batch fallita ({exc}), {len(rows)} risultati persi")
+
+
+def export_results(
+    db_path: Path,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    user_id: Optional[str] = None,
+    document_id: Optional[str] = None,
+    jurisdiction: Optional[str] = None,
+    kind: Optional[str] = None,
+    page_size: int = 1000,
+) -> Iterator[str]:
+    """Righe NDJSON dell'archivio, lette in sola lettura e paginate per id."""
+    filters: List[str] = []
+    params: List[Any] = []
+    for column, value in (
+        ("user_id", user_id),
+        ("document_id", document_id),
+        ("jurisdiction", jurisdiction),
+        ("kind", kind),
+    ):
+        if value is not None:
+            filters.append(f"{column} = ?")
+            params.append(value)
+    time_filters: List[str] = []
+    time_params: List[Any] = []
+    if since is not None:
+        time_filters.append("created_at >= ?")
+        time_params.append(since)
+    if until is not None:
+        time_filters.append("created_at < ?")
+        time_params.append(until)
+    where = "".join(f" AND {clause}" for clause in [*filters, *time_filters])
+    time_where = f" WHERE {' AND '.join(time_filters)}" if time_filters else ""
+    query = (
+        f"SELECT {', '.join(EXPORT_COLUMNS)}, result FROM results "
+        f"WHERE id > ? AND id <= ?{where} ORDER BY id LIMIT ?"
+    )
+
+    # StreamingResponse pulls pages from threadpool workers: the generator is consumed serially,
+    # but not necessarily on the thread that opened the connection.
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+    try:
+        # Bound the id range through the created_at index, so a time window does not scan the
+        # whole table page after page.
+        first_id, last_match = conn.execute(f"SELECT MIN(id), MAX(id) FROM results{time_where}", time_params).fetchone()
+        if first_id is None:
+            return
+        last_id = first_id - 1
+        while True:
+            rows = conn.execute(query, [last_id, last_match, *params, *time_params, page_size]).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                header = json.dumps(dict(zip(EXPORT_COLUMNS, row[:-1])), ensure_ascii=False)
+                yield f'{header[:-1]}, "result": {row[-1]}}}\n'
+            last_id = rows[-1][0]
+    finally:
+        conn.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Esporta in NDJSON l'archivio dei risultati.")
+    parser.add_argument("db_path", type=Path, help="file SQLite indicato in RESULT_STORE_PATH")
+    parser.add_argument("--since", help="data/ora ISO inclusiva (UTC)")
+    parser.add_argument("--until", help="data/ora ISO esclusiva (UTC)")
+    parser.add_argument("--user-id")
+    parser.add_argument("--document-id")
+    parser.add_argument("--jurisdiction")
+    parser.add_argument("--kind", choices=["analysis", "document"])
+    parser.add_argument("--output", type=Path, help="file di destinazione (default stdout)")
+    args = parser.parse_args(argv)
+
+    if not args.db_path.exists():
+        parser.error(f"archivio {args.db_path} non trovato")
+    output = args.output.open("w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for line in export_results(
+            args.db_path,
+            since=args.since,
+            until=args.until,
+            user_id=args.user_id,
+            document_id=args.document_id,
+            jurisdiction=args.jurisdiction.strip().title() if args.jurisdiction else None,
+            kind=args.kind,
+        ):
+            output.write(line)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -38,6 +38,15 @@ class Reference(BaseModel):
     url: HttpUrl
 
 
+class ReferenceRecord(BaseModel):
+    id: str = Field(..., min_length=1)
+    source: Literal["norma", "giurisprudenza", "policy"]
+    citation: str = Field(..., min_length=1)
+    url: HttpUrl
+    keywords: List[str] = Field(default_factory=list)
+    content: str = ""
+
+
 class AnalysisIssue(BaseModel):
     type: Literal["process", "formality", "substance"]
     issue: str
@@ -0,0 +1,166 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger("bureaucracy_agent_brain")
+
+_STOP = object()
+_CLEAR = object()
+
+
+class TieredCache:
+    """Cache chiave -> bytes: LRU in memoria con un livello SQLite opzionale.
+
+    Le scritture su disco passano da un thread dedicato (in batch, con eviction ogni
+    `evict_every` inserimenti), quindi `put` non tocca mai SQLite; `get` lo legge solo
+    se la chiave non è in memoria: da codice asincrono va chiamato nel threadpool quando
+    `persistent` è vero.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 1000,
+        db_path: Optional[Path] = None,
+        disk_max_entries: int = 100000,
+        evict_every: int = 0,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self.evict_every = evict_every or max(1, disk_max_entries // 100)
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        if db_path is not None:
+            self._db = self._connect(db_path)
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} ("
+                "key TEXT PRIMARY KEY, "
+                "value BLOB NOT NULL, "
+                "created_at REAL NOT NULL)"
+            )
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS {name}_created_at ON {name} (created_at)")
+            self._db.commit()
+            self._writer = threading.Thread(
+                target=self._run,
+                args=(self._connect(db_path),),
+                name=f"{name}-cache-writer",
+                daemon=True,
+            )
+            self._writer.start()
+
+    @property
+    def persistent(self) -> bool:
+        return self._db is not None
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._db.execute(f"SELECT value FROM {self.name} WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as exc:
+            logger.warning(f"TieredCache[{self.name}]: lettura da disco fallita ({exc})")
+            return None
+        if row is None:
+            return None
+        value = bytes(row[0])
+        with self._lock:
+            self._remember(key, value)
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._remember(key, value)
+        if self._writer is not None:
+            self._queue.put((key, value, time.time()))
+
+    def flush(self) -> None:
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        if self._writer is None or not self._writer.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self._writer is not None:
+            self._queue.put(_CLEAR)
+            self._queue.join()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remember(self, key: str, value: bytes) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _connect(db_path: Path) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(db_path), timeout=5.0, check_same_thread=False)
+        # WAL lets the request path read while the writer thread commits.
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _run(self, conn: sqlite3.Connection) -> None:
+        since_eviction = 0
+        stopping = False
+        while not stopping:
+            batch: List[Tuple[str, bytes, float]] = []
+            clear = False
+            item = self._queue.get()
+            taken = 1
+            while True:
+                if item is _STOP:
+                    stopping = True
+                elif item is _CLEAR:
+                    clear = True
+                else:
+                    batch.append(item)
+                if stopping or clear:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                    taken += 1
+                except queue.Empty:
+                    break
+            try:
+                with conn:
+                    conn.executemany(f"INSERT OR REPLACE INTO {self.name} VALUES (?, ?, ?)", batch)
+                    since_eviction += len(batch)
+                    if clear:
+                        conn.execute(f"DELETE FROM {self.name}")
+                        since_eviction = 0
+                    elif since_eviction >= self.evict_every:
+                        conn.execute(
+                            f"DELETE FROM {self.name} WHERE rowid IN ("
+                            f"SELECT rowid FROM {self.name} ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                            (self.disk_max_entries,),
+                        )
+                        since_eviction = 0
+            except sqlite3.Error as exc:
+                logger.warning(f"TieredCache[{self.name}]: scrittura su disco fallita ({exc}), {len(batch)} voci perse")
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+        conn.close()
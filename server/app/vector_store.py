@@ -1,9 +1,14 @@
+import fcntl
+import hashlib
 import json
 import logging
+import os
 import re
+import threading
 from collections import Counter
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from .schemas import Reference
 
@@ -17,36 +22,199 @@ def _normalize(text: str) -> List[str]:
     return [token for token in cleaned.split() if token]
 
 
+def _index_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    tokens = _normalize(entry.get("content", ""))
+    keywords = [key.lower() for key in entry.get("keywords", [])]
+    return {
+        "raw": entry,
+        "reference": Reference(
+            source=entry["source"],
+            citation=entry["citation"],
+            url=entry["url"],
+        ),
+        "keywords": keywords,
+        "tokens": Counter(tokens),
+    }
+
+
 class VectorStore:
-    def __init__(self, records_file: Path = STORE_FILE):
-        self.records = []
+    """Indice delle norme: JSON di base + WAL in append condiviso fra processi.
+
+    WAL, `.lock` e `.leader` stanno in `state_dir` (default la cartella del JSON). Append e
+    compattazione avvengono sotto un flock esclusivo su `.lock`; solo il processo che detiene
+    `.leader` compatta, gli altri seguono il WAL e ricaricano il JSON quando il leader lo riscrive.
+    La sola lettura non crea file: se `state_dir` non è scrivibile lo store resta in sola lettura.
+    """
+
+    def __init__(self, records_file: Path = STORE_FILE, state_dir: Optional[Path] = None):
+        self.records_file = records_file
+        state_dir = Path(state_dir) if state_dir is not None else records_file.parent
+        self.wal_file = state_dir / f"{records_file.stem}.wal"
+        self.lock_file = state_dir / f"{records_file.stem}.lock"
+        self.leader_file = state_dir / f"{records_file.stem}.leader"
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.version = 0
+        self.revision = hashlib.sha256(b"").hexdigest()
+        self.is_leader = False
+        self.read_only = False
+        self._pending_ops = 0
+        self._base_signature: Optional[Tuple[int, int, int]] = None
+        self._wal_inode: Optional[int] = None
+        self._wal_offset = 0
+        self._wal_size = 0
+        self._leader_fd: Optional[int] = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._compaction_stop: Optional[threading.Event] = None
         if not records_file.exists():
             logger.warning(
                 f"VectorStore: file {records_file} non trovato. "
                 "L'analisi funzionerà con riferimenti di fallback."
             )
+        try:
+            # A torn WAL tail is left for the first writer to truncate under the exclusive lock.
+            with self._write_lock, self._file_lock(exclusive=False):
+                self._catch_up(truncate_torn_tail=False)
+        except OSError as exc:
+            logger.warning(f"VectorStore: WAL non leggibile in {self.wal_file} ({exc}), uso il solo JSON di base")
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def upsert(self, *entries: Dict[str, Any]) -> int:
+        indexed = []
+        for entry in entries:
+            if not entry.get("id"):
+                raise ValueError("VectorStore.upsert: ogni record deve avere un 'id'")
+            indexed.append((str(entry["id"]), _index_entry(entry)))
+        with self._write_lock, self._file_lock(exclusive=True):
+            self._catch_up(truncate_torn_tail=True)
+            lines = self._append_wal([{"op": "upsert", "record": entry} for entry in entries])
+            with self._lock:
+                for record_id, item in indexed:
+                    self.records[record_id] = item
+                self._applied(lines)
+        return len(indexed)
+
+    def delete(self, *record_ids: str) -> int:
+        with self._write_lock, self._file_lock(exclusive=True):
+            self._catch_up(truncate_torn_tail=True)
+            existing = [record_id for record_id in record_ids if record_id in self.records]
+            if not existing:
+                return 0
+            lines = self._append_wal([{"op": "delete", "id": record_id} for record_id in existing])
+            with self._lock:
+                for record_id in existing:
+                    self.records.pop(record_id, None)
+                self._applied(lines)
+        return len(existing)
+
+    def needs_refresh(self) -> bool:
+        """Solo `stat`: vero se JSON o WAL sono cambiati dall'ultima lettura (es. scritti da un altro processo)."""
+        if self._signature(self.records_file) != self._base_signature:
+            return True
+        wal_signature = self._signature(self.wal_file)
+        if wal_signature is None:
+            return self._wal_inode is not None
+        return wal_signature[0] != self._wal_inode or wal_signature[2] != self._wal_size
+
+    def refresh(self) -> None:
+        """Applica le operazioni scritte nel WAL da altri processi."""
+        if not self.needs_refresh():
             return
-        raw = json.loads(records_file.read_text(encoding="utf-8"))
-        for entry in raw:
-            tokens = _normalize(entry.get("content", ""))
-            keywords = [key.lower() for key in entry.get("keywords", [])]
-            self.records.append(
-                {
-                    "reference": Reference(
-                        source=entry["source"],
-                        citation=entry["citation"],
-                        url=entry["url"],
-                    ),
-                    "keywords": keywords,
-                    "tokens": Counter(tokens),
-                }
-            )
+        with self._write_lock, self._file_lock(exclusive=False):
+            self._catch_up(truncate_torn_tail=False)
+
+    def compact(self) -> bool:
+        if not self.is_leader:
+            return False
+        with self._write_lock, self._file_lock(exclusive=True):
+            self._catch_up(truncate_torn_tail=True)
+            if self._pending_ops == 0:
+                return False
+            with self._lock:
+                raw = [item["raw"] for item in self.records.values()]
+            content = (json.dumps(raw, ensure_ascii=False, indent=2) + "\n").encode("utf-8")
+            tmp_path = self.records_file.with_suffix(self.records_file.suffix + ".tmp")
+            tmp_path.write_bytes(content)
+            os.replace(tmp_path, self.records_file)
+            self.wal_file.unlink(missing_ok=True)
+            compacted = self._pending_ops
+            with self._lock:
+                # Same revision followers compute when they reload the rewritten JSON.
+                self.revision = hashlib.sha256(content).hexdigest()
+                self.version += 1
+            self._base_signature = self._signature(self.records_file)
+            self._wal_inode = None
+            self._wal_offset = 0
+            self._wal_size = 0
+            self._pending_ops = 0
+        logger.info(json.dumps({"event": "vector_store.compacted", "operations": compacted, "records": len(raw)}))
+        return True
+
+    def try_acquire_leadership(self) -> bool:
+        if self.is_leader:
+            return True
+        if self.read_only:
+            return False
+        try:
+            fd = os.open(self.leader_file, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as exc:
+            self._fall_back_read_only(exc)
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._leader_fd = fd
+        self.is_leader = True
+        logger.info(json.dumps({"event": "vector_store.leader", "pid": os.getpid()}))
+        return True
+
+    def release_leadership(self) -> None:
+        if self._leader_fd is not None:
+            os.close(self._leader_fd)
+            self._leader_fd = None
+        self.is_leader = False
+
+    def start_background_compaction(self, interval: float, min_ops: int = 1) -> None:
+        """Ogni `interval` secondi segue il WAL; il processo leader lo compatta."""
+        if self._compaction_stop is not None:
+            return
+        self._compaction_stop = threading.Event()
+
+        def run(stop: threading.Event) -> None:
+            while not stop.wait(interval):
+                try:
+                    self.refresh()
+                    # Leadership is only claimed when there is something to compact, so a store
+                    # that is never written does not create files in `state_dir`.
+                    if self._pending_ops >= min_ops and self.try_acquire_leadership():
+                        self.compact()
+                except OSError as exc:
+                    logger.warning(f"VectorStore: manutenzione WAL fallita ({exc})")
+
+        threading.Thread(
+            target=run,
+            args=(self._compaction_stop,),
+            name="vector-store-compaction",
+            daemon=True,
+        ).start()
+
+    def stop_background_compaction(self) -> None:
+        if self._compaction_stop is not None:
+            self._compaction_stop.set()
+            self._compaction_stop = None
 
     def query(self, text: str, limit: int = 3) -> List[Reference]:
+        self.refresh()
         candidates: List[Tuple[float, Reference]] = []
         normalized = _normalize(text)
         text_count = Counter(normalized)
-        for entry in self.records:
+        with self._lock:
+            entries = list(self.records.values())
+        for entry in entries:
             score = 0.0
             keyword_hits = sum(1 for keyword in entry["keywords"] if keyword in text.lower())
             score += keyword_hits * 0.6
@@ -56,3 +224,138 @@ class VectorStore:
                 candidates.append((score, entry["reference"]))
         candidates.sort(key=lambda pair: pair[0], reverse=True)
         return [reference for _, reference in candidates[:limit]]
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool) -> Iterator[None]:
+        fd: Optional[int] = None
+        if exclusive:
+            if self.read_only:
+                raise PermissionError(f"VectorStore: {self.lock_file.parent} in sola lettura")
+            try:
+                fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError as exc:
+                self._fall_back_read_only(exc)
+                raise PermissionError(f"VectorStore: {self.lock_file.parent} in sola lettura") from exc
+        else:
+            try:
+                fd = os.open(self.lock_file, os.O_RDONLY)
+            except OSError:
+                # No writer has ever created the lock (or it is unreadable): readers go without it.
+                fd = None
+        try:
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def _fall_back_read_only(self, exc: OSError) -> None:
+        if not self.read_only:
+            logger.warning(
+                f"VectorStore: impossibile scrivere in {self.lock_file.parent} ({exc}). "
+                "Le norme restano in sola lettura."
+            )
+        self.read_only = True
+
+    @staticmethod
+    def _signature(path: Path) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load_base(self) -> None:
+        records: Dict[str, Dict[str, Any]] = {}
+        revision = hashlib.sha256(b"").hexdigest()
+        if self.records_file.exists():
+            content = self.records_file.read_bytes()
+            revision = hashlib.sha256(content).hexdigest()
+            for position, entry in enumerate(json.loads(content)):
+                record_id = str(entry.get("id", position))
+                records[record_id] = _index_entry(entry)
+        with self._lock:
+            self.records = records
+            self.revision = revision
+        self._base_signature = self._signature(self.records_file)
+        self._wal_inode = None
+        self._wal_offset = 0
+        self._wal_size = 0
+        self._pending_ops = 0
+
+    def _catch_up(self, truncate_torn_tail: bool) -> None:
+        # Called with the file lock held: the JSON and the WAL cannot change underneath.
+        changed = False
+        if self._base_signature is None or self._signature(self.records_file) != self._base_signature:
+            self._load_base()
+            changed = True
+        wal_signature = self._signature(self.wal_file)
+        if wal_signature is None:
+            self._wal_inode = None
+            if changed:
+                self.version += 1
+            return
+        if self._wal_inode is not None and wal_signature[0] != self._wal_inode:
+            self._load_base()
+            changed = True
+        self._wal_inode = wal_signature[0]
+        valid_bytes = self._wal_offset
+        with self.wal_file.open("rb") as wal:
+            wal.seek(self._wal_offset)
+            for raw_line in wal:
+                try:
+                    if not raw_line.endswith(b"\n"):
+                        raise ValueError("riga senza terminatore")
+                    line = raw_line.decode("utf-8").rstrip("\n")
+                    operation = json.loads(line)
+                except ValueError:
+                    break
+                with self._lock:
+                    if operation["op"] == "upsert":
+                        record = operation["record"]
+                        self.records[str(record["id"])] = _index_entry(record)
+                    elif operation["op"] == "delete":
+                        self.records.pop(operation["id"], None)
+                    self._advance_revision(line)
+                self._pending_ops += 1
+                valid_bytes += len(raw_line)
+                changed = True
+        self._wal_offset = valid_bytes
+        self._wal_size = max(wal_signature[2], valid_bytes)
+        if truncate_torn_tail and valid_bytes < wal_signature[2]:
+            # A torn tail from a crash mid-append was never acknowledged: cut it off so the
+            # next append starts on a clean line instead of being glued onto the garbage.
+            logger.warning(
+                f"VectorStore: coda WAL non valida troncata in {self.wal_file} "
+                f"({wal_signature[2] - valid_bytes} byte)"
+            )
+            with self.wal_file.open("r+b") as wal:
+                wal.truncate(valid_bytes)
+                os.fsync(wal.fileno())
+            self._wal_size = valid_bytes
+        if changed:
+            self.version += 1
+
+    def _append_wal(self, operations: List[Dict[str, Any]]) -> List[str]:
+        lines = [json.dumps(operation, ensure_ascii=False) for operation in operations]
+        payload = "".join(line + "\n" for line in lines).encode("utf-8")
+        with self.wal_file.open("ab") as wal:
+            wal.write(payload)
+            wal.flush()
+            os.fsync(wal.fileno())
+            stat = os.fstat(wal.fileno())
+            self._wal_inode = stat.st_ino
+            self._wal_size = stat.st_size
+        self._wal_offset += len(payload)
+        self._pending_ops += len(lines)
+        return lines
+
+    def _applied(self, wal_lines: List[str]) -> None:
+        for line in wal_lines:
+            self._advance_revision(line)
+        self.version += 1
+
+    def _advance_revision(self, wal_line: str) -> None:
+        # Chained over WAL lines so processes with the same history agree on the revision.
+        self.revision = hashlib.sha256(f"{self.revision}\n{wal_line}".encode("utf-8")).hexdigest()
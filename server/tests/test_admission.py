@@ -0,0 +1,67 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app import main
+from app.admission import AdmissionLane
+from app.main import app
+
+
+def test_lane_queues_then_sheds_excess():
+    async def scenario():
+        lane = AdmissionLane("/analyze", max_in_flight=1, max_queue=1, queue_timeout=1.0)
+        assert await lane.acquire()
+        queued = asyncio.create_task(lane.acquire())
+        await asyncio.sleep(0)
+        assert lane.queued == 1
+        assert not await lane.acquire()
+        lane.release(0.5)
+        assert await queued
+        assert lane.in_flight == 1 and lane.queued == 0
+        lane.release(0.5)
+        assert lane.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_lane_queue_deadline_expires():
+    async def scenario():
+        lane = AdmissionLane("/analyze", max_in_flight=1, max_queue=4, queue_timeout=0.01)
+        assert await lane.acquire()
+        assert not await lane.acquire()
+        assert lane.queued == 0
+
+    asyncio.run(scenario())
+
+
+def test_overloaded_analyze_returns_503_but_health_stays_up(monkeypatch):
+    lane = AdmissionLane("/analyze", max_in_flight=0, max_queue=0, queue_timeout=0, initial_service_time=2.5)
+    monkeypatch.setitem(main.ADMISSION_LANES, "/analyze", lane)
+    client = TestClient(app)
+    response = client.post(
+        "/analyze",
+        json={},
+        headers={"Authorization": "Bearer changeme", "Request-Id": "req-overload"},
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    assert client.get("/health").status_code == 200
+
+
+def test_slot_handed_over_at_deadline_is_kept(monkeypatch):
+    async def handed_over_then_timed_out(waiter, timeout):
+        lane.release(0.1)
+        await asyncio.sleep(0)
+        raise asyncio.TimeoutError
+
+    lane = AdmissionLane("/analyze", max_in_flight=1, max_queue=1, queue_timeout=0.05)
+
+    async def scenario():
+        assert await lane.acquire()
+        monkeypatch.setattr(asyncio, "wait_for", handed_over_then_timed_out)
+        assert await lane.acquire()
+        assert lane.in_flight == 1
+        lane.release(0.1)
+        assert lane.in_flight == 0
+
+    asyncio.run(scenario())
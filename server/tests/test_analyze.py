@@ -27,7 +27,7 @@ def test_analyze_returns_expected_summary(text: str, expected_risk: str):
     }
     headers = {
         "Authorization": "Bearer changeme",
-        "Request-Id": "req-1",
+        "Request-Id": f"req-1-{expected_risk}",
     }
     response = client.post("/analyze", json=payload, headers=headers)
     assert response.status_code == 200
@@ -0,0 +1,81 @@
+from app import engine
+from app.attachment_cache import AttachmentCache, attachment_key
+from app.schemas import AnalyzeRequest, Attachment
+
+PDF_HASH = "a" * 64
+
+
+def _request(text: str, attachments: list) -> AnalyzeRequest:
+    return AnalyzeRequest(
+        document_id="doc-attachment",
+        source="upload",
+        metadata={
+            "user_id": "attachment-tester",
+            "issue_date": "2026-06-01",
+            "amount": "200.00",
+            "jurisdiction": "Genova",
+        },
+        text=text,
+        attachments=attachments,
+    )
+
+
+def test_same_attachment_reuses_extraction(monkeypatch):
+    calls = []
+    original_query = engine.VECTOR_STORE.query
+    monkeypatch.setattr(engine, "ATTACHMENT_CACHE", AttachmentCache())
+    monkeypatch.setattr(engine.VECTOR_STORE, "query", lambda text: calls.append(text) or original_query(text))
+    attachment = Attachment(filename="multa.pdf", mime_type="application/pdf", hash=PDF_HASH)
+
+    first = engine.analyze_text(_request("Verbale notificato oltre il termine", [attachment]))
+    second = engine.analyze_text(_request("Verbale notificato oltre il termine", [attachment]))
+    assert first == second
+    assert len(calls) == 1
+
+    engine.analyze_text(_request("Testo diverso per lo stesso allegato", [attachment]))
+    engine.analyze_text(_request("Verbale notificato oltre il termine", []))
+    assert len(calls) == 3
+
+
+def test_attachment_cache_survives_restart(tmp_path):
+    db_path = tmp_path / "attachments.sqlite3"
+    key = attachment_key([Attachment(filename="a.pdf", mime_type="application/pdf", hash=PDF_HASH)])
+    cache = AttachmentCache(db_path=db_path)
+    cache.put(key, "testo", ({"year": "2026"}, True, []))
+    cache.close()
+    assert AttachmentCache(db_path=db_path).get(key, "testo") == ({"year": "2026"}, True, [])
+    assert AttachmentCache(db_path=db_path).get(key, "altro testo") is None
+
+
+def test_attachment_cache_misses_after_reference_store_changes(tmp_path, monkeypatch):
+    records_file = tmp_path / "reference_store.json"
+    records_file.write_text(
+        '[{"id": "r1", "source": "norma", "citation": "OLD", "url": "https://norma.example/1",'
+        ' "keywords": ["verbale"], "content": "verbale"}]',
+        encoding="utf-8",
+    )
+    store = engine.VectorStore(records_file)
+    monkeypatch.setattr(engine, "VECTOR_STORE", store)
+    monkeypatch.setattr(engine, "ATTACHMENT_CACHE", AttachmentCache(db_path=tmp_path / "attachments.sqlite3"))
+    attachment = Attachment(filename="multa.pdf", mime_type="application/pdf", hash=PDF_HASH)
+    request = _request("Verbale notificato oltre il termine", [attachment])
+    assert [ref.citation for ref in engine.extract_content(request)[2]] == ["OLD"]
+
+    store.upsert(
+        {
+            "id": "r1",
+            "source": "norma",
+            "citation": "NEW",
+            "url": "https://norma.example/1",
+            "keywords": ["verbale"],
+            "content": "verbale",
+        }
+    )
+    assert store.try_acquire_leadership()
+    store.compact()
+    store.release_leadership()
+    restarted = engine.VectorStore(records_file)
+    assert restarted.version < store.version
+    monkeypatch.setattr(engine, "VECTOR_STORE", restarted)
+    monkeypatch.setattr(engine, "ATTACHMENT_CACHE", AttachmentCache(db_path=tmp_path / "attachments.sqlite3"))
+    assert [ref.citation for ref in engine.extract_content(request)[2]] == ["NEW"]
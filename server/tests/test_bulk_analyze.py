@@ -0,0 +1,76 @@
+import io
+import json
+
+from app.bulk_analyze import Checkpoint, main, read_records, run
+
+
+def _record(index: int) -> dict:
+    return {
+        "document_id": f"bulk-{index}",
+        "source": "ocr",
+        "metadata": {
+            "user_id": "bulk-tester",
+            "issue_date": "2026-05-01",
+            "amount": "75.00",
+            "jurisdiction": "Napoli",
+        },
+        "text": "Notifica con termine superato" if index % 2 else "x",
+    }
+
+
+def test_bulk_run_preserves_input_order_and_reports_errors():
+    output = io.StringIO()
+    report = run((_record(index) for index in range(10)), output, workers=2, chunk_size=3, max_in_flight=2)
+    rows = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [row["document_id"] for row in rows] == [f"bulk-{index}" for index in range(10)]
+    assert "error" in rows[0] and "results" in rows[1]
+    assert report["documents"] == 10
+
+
+def test_bulk_run_resumes_from_checkpoint(tmp_path):
+    checkpoint_path = tmp_path / "bulk.checkpoint"
+    checkpoint = Checkpoint(checkpoint_path)
+    for index in (0, 1, 2, 5):
+        checkpoint.mark(index)
+    checkpoint.save(io.StringIO())
+
+    output = io.StringIO()
+    resumed = Checkpoint(checkpoint_path)
+    assert resumed.watermark == 3 and resumed.done == {5}
+    run((_record(index) for index in range(8)), output, workers=2, chunk_size=2, ordered=False, checkpoint=resumed)
+    processed = sorted(json.loads(line)["document_id"] for line in output.getvalue().splitlines())
+    assert processed == ["bulk-3", "bulk-4", "bulk-6", "bulk-7"]
+    assert Checkpoint(checkpoint_path).watermark == 8
+
+
+def test_bulk_run_reports_malformed_lines_as_errors(tmp_path):
+    source = tmp_path / "input.ndjson"
+    source.write_text(
+        "\n".join([json.dumps(_record(1)), "{not json", "[1, 2]", json.dumps(_record(3))]) + "\n",
+        encoding="utf-8",
+    )
+    output = io.StringIO()
+    report = run(read_records([str(source)], "auto"), output, workers=2, chunk_size=2)
+    rows = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [row.get("index") for row in rows] == [None, 1, 2, None]
+    assert rows[1]["error"][0]["type"] == "json_invalid"
+    assert rows[2]["error"][0]["type"] == "model_type"
+    assert rows[3]["document_id"] == "bulk-3"
+    assert report["documents"] == 4
+
+
+def test_bulk_resume_truncates_rows_written_after_checkpoint(tmp_path):
+    source = tmp_path / "input.ndjson"
+    source.write_text("".join(json.dumps(_record(index)) + "\n" for index in range(6)), encoding="utf-8")
+    output_path = tmp_path / "output.ndjson"
+    checkpoint_path = tmp_path / "bulk.checkpoint"
+
+    # Simulate a crash: rows 0-1 are checkpointed, row 2 reached the output but not the checkpoint.
+    with output_path.open("w", encoding="utf-8") as output:
+        checkpoint = Checkpoint(checkpoint_path)
+        run((_record(index) for index in range(2)), output, workers=1, checkpoint=checkpoint)
+        output.write(json.dumps({"document_id": "bulk-2"}) + "\n")
+
+    main([str(source), "--output", str(output_path), "--checkpoint", str(checkpoint_path), "--workers", "1"])
+    rows = [json.loads(line) for line in output_path.read_text(encoding="utf-8").splitlines()]
+    assert [row["document_id"] for row in rows] == [f"bulk-{index}" for index in range(6)]
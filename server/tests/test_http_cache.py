@@ -0,0 +1,129 @@
+import gzip
+import json
+
+from fastapi.testclient import TestClient
+
+from app import main
+from app.http_cache import etag_matches, negotiate_encoding, representation_etag
+from app.main import app
+from app.result_store import ResultStore
+
+
+def _document_payload(actions: int) -> dict:
+    return {
+        "document_id": "doc-etag",
+        "user_id": "etag-tester",
+        "issue_type": "process",
+        "actions": [f"Azione numero {index} da eseguire" for index in range(actions)],
+        "references": [
+            {"source": "norma", "citation": "art. 3", "url": "https://norma.example/art3"}
+        ],
+        "summary_next_step": "Invia prima possibile",
+    }
+
+
+def _engine_must_not_run(payload):
+    raise AssertionError("il documento doveva arrivare dalla cache")
+
+
+def test_negotiation_and_etag_matching():
+    assert negotiate_encoding("gzip;q=0.5, identity") == "gzip"
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding(None) is None
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches('"abc"', 'W/"abc"')
+    assert representation_etag('W/"abc"', "gzip") == 'W/"abc-gzip"'
+    assert representation_etag('"abc"', None) == '"abc"'
+    assert not etag_matches('"abc"', '"def"')
+    assert not etag_matches("*", '"abc"')
+
+
+def test_if_none_match_returns_304_without_running_engine(monkeypatch):
+    client = TestClient(app)
+    headers = {"Authorization": "Bearer changeme", "Request-Id": "req-etag-1"}
+    first = client.post("/generate-document", json=_document_payload(2), headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    monkeypatch.setattr(main, "build_document_text", _engine_must_not_run)
+    second = client.post(
+        "/generate-document",
+        json=_document_payload(2),
+        headers={**headers, "Request-Id": "req-etag-2", "If-None-Match": etag},
+    )
+    assert second.status_code == 304
+    assert second.headers["ETag"] == etag
+    assert second.content == b""
+
+
+def test_large_documents_are_compressed_and_cached(monkeypatch):
+    monkeypatch.setattr(main, "PRECOMPRESSED_CACHE", main.TieredCache("precompressed", max_entries=4))
+    client = TestClient(app)
+    headers = {"Authorization": "Bearer changeme", "Accept-Encoding": "gzip"}
+    payload = _document_payload(200)
+    first = client.post("/generate-document", json=payload, headers={**headers, "Request-Id": "req-gzip-1"})
+    assert first.status_code == 200
+    assert first.headers["Content-Encoding"] == "gzip"
+    assert len(main.PRECOMPRESSED_CACHE) == 1
+    identity = client.post(
+        "/generate-document",
+        json=payload,
+        headers={"Authorization": "Bearer changeme", "Accept-Encoding": "identity", "Request-Id": "req-gzip-3"},
+    )
+    assert identity.headers["ETag"] == first.headers["ETag"].removesuffix('-gzip"') + '"'
+
+    monkeypatch.setattr(main, "build_document_text", _engine_must_not_run)
+    second = client.post("/generate-document", json=payload, headers={**headers, "Request-Id": "req-gzip-2"})
+    assert second.status_code == 200
+    assert second.headers["Content-Encoding"] == "gzip"
+    assert second.json() == first.json()
+    assert first.headers["ETag"].endswith('-gzip"')
+    assert second.headers["ETag"] == first.headers["ETag"]
+    cached = main.PRECOMPRESSED_CACHE.get(first.headers["ETag"])
+    assert gzip.decompress(cached) == first.content
+
+
+def test_analyze_etag_is_weak():
+    client = TestClient(app)
+    payload = {
+        "document_id": "doc-weak",
+        "source": "ocr",
+        "metadata": {
+            "user_id": "etag-tester",
+            "issue_date": "2026-03-01",
+            "amount": "120.00",
+            "jurisdiction": "Torino",
+        },
+        "text": "Notifica con termine superato",
+    }
+    headers = {"Authorization": "Bearer changeme", "Request-Id": "req-weak-1"}
+    first = client.post("/analyze", json=payload, headers=headers)
+    assert first.headers["ETag"].startswith('W/"')
+    revalidated = client.post(
+        "/analyze",
+        json=payload,
+        headers={**headers, "Request-Id": "req-weak-2", "If-None-Match": first.headers["ETag"]},
+    )
+    assert revalidated.status_code == 304
+
+
+def test_cache_hits_require_request_id_and_are_archived(tmp_path, monkeypatch):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    monkeypatch.setattr(main, "RESULT_STORE", store)
+    monkeypatch.setattr(main, "PRECOMPRESSED_CACHE", main.TieredCache("precompressed", max_entries=4))
+    client = TestClient(app)
+    headers = {"Authorization": "Bearer changeme", "Accept-Encoding": "gzip"}
+    payload = _document_payload(200)
+    first = client.post("/generate-document", json=payload, headers={**headers, "Request-Id": "req-hit-1"})
+    assert first.status_code == 200
+
+    monkeypatch.setattr(main, "build_document_text", _engine_must_not_run)
+    missing_id = client.post("/generate-document", json=payload, headers={**headers, "If-None-Match": first.headers["ETag"]})
+    assert missing_id.status_code == 400
+    hit = client.post("/generate-document", json=payload, headers={**headers, "Request-Id": "req-hit-2"})
+    assert hit.status_code == 200
+    store.flush()
+    archived = [json.loads(line) for line in store.export()]
+    assert [row["request_id"] for row in archived] == ["req-hit-1", "req-hit-2"]
+    assert archived[1]["user_id"] == "etag-tester"
+    store.close()
@@ -0,0 +1,53 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from app import main
+from app.main import app
+from app.profiling import ProfileStore, RequestProfile
+
+
+def test_profile_store_keeps_bounded_ring(tmp_path):
+    store = ProfileStore(tmp_path, max_profiles=2)
+    profile = RequestProfile()
+    profile.stacks["analyze_text (engine.py:1)"] = 5000
+    for request_id in ("req-a", "req-b", "req/c"):
+        store.save(request_id, profile)
+    assert {path.name for path in tmp_path.iterdir()} == {store.path_for("req-b").name, store.path_for("req/c").name}
+    assert store.path_for("req/c") != store.path_for("req_c")
+    assert store.load("req/c") == "analyze_text (engine.py:1) 5\n"
+    assert store.load("req_c") is None
+
+
+def test_profile_token_header_profiles_analysis(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(main, "ADMIN_API_TOKEN", "admin-secret")
+    monkeypatch.setattr(main, "PROFILE_STORE", ProfileStore(tmp_path))
+    client = TestClient(app)
+    payload = {
+        "document_id": "doc-profile",
+        "source": "ocr",
+        "metadata": {
+            "user_id": "profile-tester",
+            "issue_date": "2026-07-01",
+            "amount": "300.00",
+            "jurisdiction": "Roma",
+        },
+        "text": "Verbale n. 12345/A notificato il 02/03/2026, violazione accertata il 01/01/2026. " * 200,
+    }
+    response = client.post(
+        "/analyze",
+        json=payload,
+        headers={
+            "Authorization": "Bearer changeme",
+            "Request-Id": "req-profile",
+            "Profile-Token": "admin-secret",
+        },
+    )
+    assert response.status_code == 200
+    end_records = [json.loads(record.getMessage()) for record in caplog.records if "request.end" in record.getMessage()]
+    assert end_records[-1]["profile"] == "/profiles/req-profile"
+
+    profile = client.get("/profiles/req-profile", headers={"Authorization": "Bearer admin-secret"})
+    assert profile.status_code == 200
+    assert "analyze_text (app/engine.py" in profile.text
+    assert client.get("/profiles/req-profile", headers={"Authorization": "Bearer changeme"}).status_code == 401
@@ -0,0 +1,105 @@
+import asyncio
+import sqlite3
+import time
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app import main
+from app.main import app
+from app.replay_cache import ReplayCache
+from app.tiered_cache import TieredCache
+
+
+def _payload(text: str) -> dict:
+    return {
+        "document_id": "doc-replay",
+        "source": "ocr",
+        "metadata": {
+            "user_id": "replay-tester",
+            "issue_date": "2026-03-01",
+            "amount": "120.00",
+            "jurisdiction": "Torino",
+        },
+        "text": text,
+    }
+
+
+def test_replay_cache_evicts_least_recent():
+    cache = ReplayCache(max_entries=2)
+    cache.put("u", "a", "fp-a", b"A")
+    cache.put("u", "b", "fp-b", b"B")
+    assert cache.get("u", "a") == ("fp-a", b"A")
+    cache.put("u", "c", "fp-c", b"C")
+    assert cache.get("u", "b") is None
+    assert cache.get("u", "a") == ("fp-a", b"A")
+    assert len(cache) == 2
+
+
+def test_replay_cache_survives_restart_on_disk(tmp_path):
+    db_path = tmp_path / "replay.sqlite3"
+    cache = ReplayCache(max_entries=1, db_path=db_path)
+    cache.put("u", "req", "fp", b"{}")
+    cache.close()
+    restarted = ReplayCache(max_entries=1, db_path=db_path)
+    assert restarted.get("u", "req") == ("fp", b"{}")
+
+
+def test_analyze_replays_without_consuming_quota():
+    client = TestClient(app)
+    headers = {"Authorization": "Bearer changeme", "Request-Id": "req-replay"}
+    first = client.post("/analyze", json=_payload("Notifica con termine superato"), headers=headers)
+    assert first.status_code == 200
+    quota_key = main._get_rate_limit_key("replay-tester")
+    used = main._rate_limit_store[quota_key]["count"]
+
+    replay = client.post("/analyze", json=_payload("Notifica con termine superato"), headers=headers)
+    assert replay.status_code == 200
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.content == first.content
+    assert main._rate_limit_store[quota_key]["count"] == used
+
+    conflict = client.post("/analyze", json=_payload("Un testo completamente diverso"), headers=headers)
+    assert conflict.status_code == 409
+
+
+def test_concurrent_duplicates_execute_once(monkeypatch):
+    calls = []
+    analyze_text = main.analyze_text
+
+    def slow_analyze(payload):
+        calls.append(payload.document_id)
+        time.sleep(0.2)
+        return analyze_text(payload)
+
+    monkeypatch.setattr(main, "analyze_text", slow_analyze)
+    headers = {"Authorization": "Bearer changeme", "Request-Id": "req-concurrent"}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(
+                *(client.post("/analyze", json=_payload("Notifica con termine superato"), headers=headers) for _ in range(2))
+            )
+
+    first, second = asyncio.run(scenario())
+    assert calls == ["doc-replay"]
+    assert first.status_code == second.status_code == 200
+    assert first.content == second.content
+    assert {first.headers.get("Idempotent-Replayed"), second.headers.get("Idempotent-Replayed")} == {None, "true"}
+
+
+def test_disk_tier_is_written_and_evicted_by_background_writer(tmp_path):
+    db_path = tmp_path / "tiered.sqlite3"
+    cache = TieredCache("replay", max_entries=2, db_path=db_path, disk_max_entries=4, evict_every=3)
+    for index in range(10):
+        cache.put(f"k{index}", f"v{index}".encode())
+    cache.flush()
+    with sqlite3.connect(db_path) as conn:
+        stored = conn.execute("SELECT COUNT(*) FROM replay").fetchone()[0]
+    conn.close()
+    assert 4 <= stored < 4 + 3
+    assert cache.get("k0") is None
+    assert cache.get("k9") == b"v9"
+    assert cache.get("k7") == b"v7"
+    cache.close()
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import sqlite3
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, result_store
+from app.main import app
+from app.result_store import ResultStore, export_results
+from app.schemas import DocumentResponse
+
+
+def _document(document_id: str) -> DocumentResponse:
+    return DocumentResponse(document_id=document_id, title="t", body="b", recommendations=[])
+
+
+def test_result_store_exports_filtered_pages(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3", batch_size=3)
+    for index in range(7):
+        store.record("document", f"req-{index}", "u1" if index % 2 else "u2", f"doc-{index}", None, _document(f"doc-{index}"))
+    store.flush()
+
+    rows = [json.loads(line) for line in store.export(page_size=2)]
+    assert [row["document_id"] for row in rows] == [f"doc-{index}" for index in range(7)]
+    assert rows[0]["result"]["document_id"] == "doc-0"
+
+    filtered = [json.loads(line) for line in store.export(user_id="u1", page_size=2)]
+    assert [row["request_id"] for row in filtered] == ["req-1", "req-3", "req-5"]
+    store.close()
+
+
+def test_export_endpoint_streams_ndjson(tmp_path, monkeypatch):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    monkeypatch.setattr(main, "RESULT_STORE", store)
+    monkeypatch.setattr(main, "ADMIN_API_TOKEN", "admin-secret")
+    client = TestClient(app)
+    payload = {
+        "document_id": "doc-archive",
+        "source": "ocr",
+        "metadata": {
+            "user_id": "archive-tester",
+            "issue_date": "2026-04-01",
+            "amount": "90.00",
+            "jurisdiction": "bologna",
+        },
+        "text": "Richiesta di informazioni formali",
+    }
+    response = client.post(
+        "/analyze",
+        json=payload,
+        headers={"Authorization": "Bearer changeme", "Request-Id": "req-archive"},
+    )
+    assert response.status_code == 200
+    store.flush()
+
+    denied = client.get("/results/export", headers={"Authorization": "Bearer changeme"})
+    assert denied.status_code == 401
+
+    exported = client.get(
+        "/results/export",
+        params={"jurisdiction": "bologna"},
+        headers={"Authorization": "Bearer admin-secret"},
+    )
+    assert exported.status_code == 200
+    rows = [json.loads(line) for line in exported.text.splitlines()]
+    assert len(rows) == 1
+    assert rows[0]["kind"] == "analysis"
+    assert rows[0]["result"]["summary"]["risk_level"] == "medium"
+    store.close()
+
+
+def test_export_cli_reads_time_window_without_opening_a_store(tmp_path):
+    db_path = tmp_path / "results.sqlite3"
+    store = ResultStore(db_path)
+    store.close()
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO results (kind, request_id, user_id, document_id, jurisdiction, created_at, result) "
+            "VALUES ('document', ?, 'u1', ?, NULL, ?, ?)",
+            [
+                (f"req-{day}", f"doc-{day}", f"2026-01-0{day}T00:00:00+00:00", _document(f"doc-{day}").model_dump_json())
+                for day in range(1, 6)
+            ],
+        )
+    conn.close()
+
+    output = tmp_path / "export.ndjson"
+    result_store.main([str(db_path), "--since", "2026-01-02", "--until", "2026-01-04", "--output", str(output)])
+    rows = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert [row["document_id"] for row in rows] == ["doc-2", "doc-3"]
+    assert list(export_results(db_path, since="2026-02-01")) == []
+
+    with pytest.raises(sqlite3.OperationalError):
+        list(export_results(tmp_path / "missing.sqlite3"))
+    assert not (tmp_path / "missing.sqlite3").exists()
+
+
+def test_concurrent_exports_stream_across_threadpool_workers(tmp_path, monkeypatch):
+    db_path = tmp_path / "results.sqlite3"
+    store = ResultStore(db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO results (kind, request_id, user_id, document_id, jurisdiction, created_at, result) "
+            "VALUES ('document', ?, 'u1', ?, NULL, '2026-01-01T00:00:00+00:00', '{}')",
+            [(f"req-{index}", f"doc-{index}") for index in range(3000)],
+        )
+    conn.close()
+    monkeypatch.setattr(main, "RESULT_STORE", store)
+    monkeypatch.setattr(main, "ADMIN_API_TOKEN", "admin-secret")
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(
+                *(client.get("/results/export", headers={"Authorization": "Bearer admin-secret"}) for _ in range(8))
+            )
+
+    for response in asyncio.run(scenario()):
+        assert response.status_code == 200
+        assert len(response.text.splitlines()) == 3000
+    store.close()
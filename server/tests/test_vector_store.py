@@ -0,0 +1,150 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import engine, main
+from app.main import app
+from app.vector_store import VectorStore
+
+BASE_RECORDS = [
+    {
+        "id": "r1",
+        "source": "norma",
+        "citation": "art. 3, Codice della Strada",
+        "url": "https://norma.example/art3",
+        "keywords": ["notifica"],
+        "content": "Ogni violazione deve essere notificata correttamente.",
+    }
+]
+
+RULING = {
+    "id": "cass-1",
+    "source": "giurisprudenza",
+    "citation": "Cass. civ. n. 1/2026",
+    "url": "https://giurisprudenza.example/1-2026",
+    "keywords": ["autovelox"],
+    "content": "Autovelox non omologato: sanzione annullata.",
+}
+
+
+def _store(tmp_path) -> VectorStore:
+    records_file = tmp_path / "reference_store.json"
+    records_file.write_text(json.dumps(BASE_RECORDS), encoding="utf-8")
+    return VectorStore(records_file)
+
+
+def test_upsert_and_delete_survive_restart_through_wal(tmp_path):
+    store = _store(tmp_path)
+    version = store.version
+    assert store.upsert(RULING) == 1
+    assert store.version > version
+    assert [ref.citation for ref in store.query("verbale autovelox")] == ["Cass. civ. n. 1/2026"]
+
+    reopened = VectorStore(tmp_path / "reference_store.json")
+    assert set(reopened.records) == {"r1", "cass-1"}
+
+    assert reopened.delete("r1") == 1
+    assert reopened.delete("missing") == 0
+    assert reopened.try_acquire_leadership()
+    assert reopened.compact()
+    assert not (tmp_path / "reference_store.wal").exists()
+    compacted = json.loads((tmp_path / "reference_store.json").read_text(encoding="utf-8"))
+    assert [entry["id"] for entry in compacted] == ["cass-1"]
+
+
+def test_admin_reference_endpoints(tmp_path, monkeypatch):
+    store = _store(tmp_path)
+    monkeypatch.setattr(engine, "VECTOR_STORE", store)
+    monkeypatch.setattr(main, "VECTOR_STORE", store)
+    monkeypatch.setattr(main, "ADMIN_API_TOKEN", "admin-secret")
+    client = TestClient(app)
+    admin = {"Authorization": "Bearer admin-secret"}
+
+    assert client.put("/admin/references", json=[RULING], headers={"Authorization": "Bearer changeme"}).status_code == 401
+    response = client.put("/admin/references", json=[RULING], headers=admin)
+    assert response.status_code == 200
+    assert response.json()["total"] == 2
+
+    assert client.delete("/admin/references/cass-1", headers=admin).status_code == 200
+    assert client.delete("/admin/references/cass-1", headers=admin).status_code == 404
+    assert set(store.records) == {"r1"}
+
+
+def test_torn_wal_tail_is_truncated_before_new_appends(tmp_path):
+    store = _store(tmp_path)
+    store.upsert(RULING)
+    wal_file = tmp_path / "reference_store.wal"
+    with wal_file.open("a", encoding="utf-8") as wal:
+        wal.write('{"op": "upsert", "record": {"id": "tor')
+
+    reopened = VectorStore(tmp_path / "reference_store.json")
+    assert set(reopened.records) == {"r1", "cass-1"}
+    reopened.upsert({**RULING, "id": "after-crash"})
+
+    restarted = VectorStore(tmp_path / "reference_store.json")
+    assert set(restarted.records) == {"r1", "cass-1", "after-crash"}
+
+
+def test_only_leader_compacts_and_followers_keep_their_writes(tmp_path):
+    leader = _store(tmp_path)
+    follower = VectorStore(tmp_path / "reference_store.json")
+    assert leader.try_acquire_leadership()
+    assert not follower.try_acquire_leadership()
+    assert not follower.compact()
+
+    follower.upsert(RULING)
+    leader.upsert({**RULING, "id": "leader-only"})
+    assert leader.compact()
+    assert set(leader.records) == {"r1", "cass-1", "leader-only"}
+
+    follower.refresh()
+    assert set(follower.records) == {"r1", "cass-1", "leader-only"}
+    assert follower.revision == leader.revision
+    follower.delete("r1")
+    leader.release_leadership()
+
+    restarted = VectorStore(tmp_path / "reference_store.json")
+    assert set(restarted.records) == {"cass-1", "leader-only"}
+
+
+def test_reading_creates_no_files_and_unwritable_state_falls_back_to_read_only(tmp_path, monkeypatch):
+    missing = VectorStore(tmp_path / "missing" / "reference_store.json")
+    assert len(missing) == 0 and missing.query("autovelox") == []
+
+    records_file = tmp_path / "reference_store.json"
+    records_file.write_text(json.dumps(BASE_RECORDS), encoding="utf-8")
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("", encoding="utf-8")
+    store = VectorStore(records_file, state_dir=blocker)
+    store.start_background_compaction(interval=3600)
+    store.stop_background_compaction()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["not-a-dir", "reference_store.json"]
+    assert [ref.citation for ref in store.query("notifica")] == ["art. 3, Codice della Strada"]
+
+    with pytest.raises(PermissionError):
+        store.upsert(RULING)
+    assert store.read_only and not store.try_acquire_leadership()
+
+    monkeypatch.setattr(engine, "VECTOR_STORE", store)
+    monkeypatch.setattr(main, "VECTOR_STORE", store)
+    monkeypatch.setattr(main, "ADMIN_API_TOKEN", "admin-secret")
+    response = TestClient(app).put("/admin/references", json=[RULING], headers={"Authorization": "Bearer admin-secret"})
+    assert response.status_code == 503
+
+
+def test_followers_see_other_process_writes_on_next_query(tmp_path):
+    writer = _store(tmp_path)
+    follower = VectorStore(tmp_path / "reference_store.json")
+    assert not follower.needs_refresh()
+
+    writer.upsert(RULING)
+    assert follower.needs_refresh()
+    assert [ref.citation for ref in follower.query("verbale autovelox")] == ["Cass. civ. n. 1/2026"]
+    assert follower.revision == writer.revision
+    assert not follower.needs_refresh()
+
+    assert writer.try_acquire_leadership() and writer.compact()
+    follower.query("notifica")
+    assert follower.revision == writer.revision and set(follower.records) == {"r1", "cass-1"}
+    writer.release_leadership()